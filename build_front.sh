@@ -44,8 +44,21 @@ echo -e "${YELLOW}Deploying build files...${NC}"
 if [ -d "frontend/dist/wplace-alerter" ]; then
     mv frontend/dist/wplace-alerter/* data/frontend_build/
     echo -e "${GREEN}Frontend deployed successfully to data/frontend_build/${NC}"
-    echo -e "${GREEN}Build process completed!${NC}"
 else
     echo -e "${RED}Error: Build output directory frontend/dist/wplace-alerter not found!${NC}"
     exit 1
 fi
+
+# Precompress text assets so the server can send them as they are
+echo -e "${YELLOW}Precompressing assets...${NC}"
+find data/frontend_build -type f \( -name "*.js" -o -name "*.css" -o -name "*.html" -o -name "*.txt" -o -name "*.svg" -o -name "*.ico" -o -name "*.json" \) | while read -r file; do
+    gzip -k -f -9 "$file"
+    if command -v brotli > /dev/null; then
+        brotli -k -f -q 11 "$file"
+    fi
+done
+if ! command -v brotli > /dev/null; then
+    echo -e "${YELLOW}brotli not found, only .gz variants were created${NC}"
+fi
+
+echo -e "${GREEN}Build process completed!${NC}"
@@ -1,4 +1,5 @@
 import json
+import numpy as np
 from enum import Enum
 
 
@@ -123,6 +124,33 @@ def get_color_id(rgb):
     return None, None, None
 
 
+# Palette as arrays, in the same order as get_color_id
+UNKNOWN_COLOR = 255
+PALETTE = np.array([color.value[:4] for color in Color], dtype=np.uint8)
+__palette_keys = np.ascontiguousarray(PALETTE[:, [2, 1, 0, 3]]).view(np.uint32).ravel()
+__palette_order = np.argsort(__palette_keys)
+__palette_sorted = __palette_keys[__palette_order]
+
+
+def get_color_ids(image):
+    """
+    Vectorized get_color_id for a whole BGRA image.
+
+    Args:
+        image: BGRA array with shape (height, width, 4)
+
+    Returns:
+        uint8 array with the color id of every pixel. Fully transparent pixels
+        are TRANSPARENT (0) and colors outside the palette are UNKNOWN_COLOR.
+    """
+    keys = np.ascontiguousarray(image, dtype=np.uint8).view(np.uint32)[..., 0]
+    keys = np.where(image[..., 3] == 0, 0, keys)
+    pos = np.minimum(np.searchsorted(__palette_sorted, keys), len(__palette_sorted) - 1)
+    ids = __palette_order[pos].astype(np.uint8)
+    ids[__palette_sorted[pos] != keys] = UNKNOWN_COLOR
+    return ids
+
+
 # if __name__ == "__main__":
 #     # See original values
 #     name, id_, enabled = get_color_id([237, 28, 36, 255])
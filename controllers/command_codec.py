@@ -0,0 +1,93 @@
+import re
+import base64
+
+from typing import Dict, List, Tuple
+
+
+# JS decoder for encode_pixels, rebuilding the [x, y, r, g, b, a, colorIdx] arrays
+JS_DECODER = """
+function decodePixels(encoded, palette) {
+    const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+    const pixels = [];
+    let i = 0, x = 0, y = 0;
+    const varint = () => {
+        let value = 0, shift = 0, byte;
+        do {
+            byte = bytes[i++];
+            value += (byte & 127) * 2 ** shift;
+            shift += 7;
+        } while (byte & 128);
+        return value % 2 ? -(value + 1) / 2 : value / 2;
+    };
+    while (i < bytes.length) {
+        x += varint();
+        y += varint();
+        const colorIdx = bytes[i++];
+        pixels.push([x, y, ...palette[colorIdx], colorIdx]);
+    }
+    return pixels;
+}
+""".strip()
+
+ENCODED_PATTERN = re.compile(r'decodePixels\("([A-Za-z0-9+/=]*)", (\{[^}]*\})\)')
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    # Zigzag so small negative deltas stay small
+    value = value * 2 if value >= 0 else -value * 2 - 1
+    while value > 127:
+        out.append((value & 127) | 128)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, i: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 127) << shift
+        shift += 7
+        if not byte & 128:
+            break
+    return (value // 2 if value % 2 == 0 else -(value + 1) // 2), i
+
+
+def encode_pixels(pixels: List[List[int]]) -> Tuple[str, Dict[int, List[int]]]:
+    """
+    Pack [x, y, r, g, b, a, colorIdx] pixels as delta-coded coordinates plus
+    the color id, base64 encoded. The colors go to a separate palette.
+
+    Args:
+        pixels: The pixels, as built by generate_command
+
+    Returns:
+        (base64 data, {colorIdx: [r, g, b, a]})
+    """
+    out = bytearray()
+    palette = {}
+    last_x, last_y = 0, 0
+    for x, y, r, g, b, a, color_idx in pixels:
+        write_varint(out, x - last_x)
+        write_varint(out, y - last_y)
+        out.append(color_idx)
+        palette[color_idx] = [r, g, b, a]
+        last_x, last_y = x, y
+    return base64.b64encode(bytes(out)).decode(), palette
+
+
+def decode_pixels(encoded: str, palette: Dict[int, List[int]]) -> List[List[int]]:
+    """
+    Inverse of encode_pixels.
+    """
+    data = base64.b64decode(encoded)
+    pixels = []
+    i, x, y = 0, 0, 0
+    while i < len(data):
+        dx, i = read_varint(data, i)
+        dy, i = read_varint(data, i)
+        x, y = x + dx, y + dy
+        color_idx = data[i]
+        i += 1
+        pixels.append([x, y, *palette[color_idx], color_idx])
+    return pixels
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+
+from typing import Any, Dict, List, Optional
+
+
+class Coordinator:
+    """
+    Coordination between the web processes and the checker worker through a
+    local SQLite database: a leader lease (so exactly one checker runs), a
+    command queue, a status board and the list of live nodes for sharded
+    checking.
+
+    The database is in WAL mode, so every process must run on the same host
+    with the file on a local disk (WAL needs shared memory, which network
+    filesystems don't provide).
+    """
+
+    def __init__(self, path: str = "data/coordination.db", node_id: Optional[str] = None):
+        self.path = path
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.initialized = False
+
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a connection in autocommit mode, creating the tables if needed.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self.initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS commands (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    command TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS status (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS nodes (
+                    node TEXT PRIMARY KEY,
+                    info TEXT NOT NULL,
+                    last_seen REAL NOT NULL
+                );
+            """)
+            self.initialized = True
+        return connection
+
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        Take or renew a lease. Succeeds if nobody holds it, if it expired or
+        if we already hold it.
+
+        Args:
+            name: The lease name
+            ttl: Seconds the lease is valid for without renewal
+
+        Returns:
+            bool: True if we hold the lease
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row["owner"] != self.node_id and row["expires_at"] > now:
+                connection.execute("COMMIT")
+                return False
+            connection.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (name, self.node_id, now + ttl)
+            )
+            connection.execute("COMMIT")
+            return True
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            return False
+        finally:
+            connection.close()
+
+
+    def release_lease(self, name: str) -> None:
+        connection = self.connect()
+        try:
+            connection.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.node_id))
+        finally:
+            connection.close()
+
+
+    def get_lease(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The current holder of a lease, or None if nobody holds a valid one.
+        """
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        finally:
+            connection.close()
+        if row is None or row["expires_at"] <= time.time():
+            return None
+        return {"owner": row["owner"], "expires_at": row["expires_at"]}
+
+
+    def submit_command(self, command: str, args: Dict[str, Any]) -> int:
+        """
+        Queue a command for the checker.
+
+        Returns:
+            The command id
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            cursor = connection.execute(
+                "INSERT INTO commands (command, args, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (command, json.dumps(args), now, now)
+            )
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+
+    def claim_commands(self) -> List[Dict[str, Any]]:
+        """
+        Take every pending command, marking them as running.
+        """
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute("SELECT id, command, args FROM commands WHERE status = 'pending' ORDER BY id").fetchall()
+            connection.executemany(
+                "UPDATE commands SET status = 'running', updated_at = ? WHERE id = ?",
+                [(time.time(), row["id"]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return [{"id": row["id"], "command": row["command"], "args": json.loads(row["args"])} for row in rows]
+
+
+    def finish_command(self, command_id: int, result: Dict[str, Any], status: str = "done") -> None:
+        connection = self.connect()
+        try:
+            connection.execute(
+                "UPDATE commands SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result), time.time(), command_id)
+            )
+            # Forget old finished commands
+            connection.execute("DELETE FROM commands WHERE status IN ('done', 'error') AND updated_at < ?", (time.time() - 86400,))
+        finally:
+            connection.close()
+
+
+    def get_command(self, command_id: int) -> Optional[Dict[str, Any]]:
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT * FROM commands WHERE id = ?", (command_id,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "command": row["command"],
+            "args": json.loads(row["args"]),
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+
+    def wait_command(self, command_id: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait until a command is finished.
+
+        Returns:
+            The command, or None if it did not finish in time
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            command = self.get_command(command_id)
+            if command is None or command["status"] in ("done", "error"):
+                return command
+            time.sleep(0.5)
+        return None
+
+
+    def set_status(self, key: str, value: Dict[str, Any]) -> None:
+        connection = self.connect()
+        try:
+            connection.execute(
+                "INSERT INTO status (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, json.dumps(value), time.time())
+            )
+        finally:
+            connection.close()
+
+
+    def get_status(self, key: str) -> Optional[Dict[str, Any]]:
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT value, updated_at FROM status WHERE key = ?", (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return {**json.loads(row["value"]), "updated_at": row["updated_at"]}
+
+
+    def heartbeat(self, info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Tell the other nodes this one is alive.
+
+        Args:
+            info: Status shown with the node
+        """
+        connection = self.connect()
+        try:
+            connection.execute(
+                "INSERT INTO nodes (node, info, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(node) DO UPDATE SET info = excluded.info, last_seen = excluded.last_seen",
+                (self.node_id, json.dumps(info or {}), time.time())
+            )
+        finally:
+            connection.close()
+
+
+    def leave(self) -> None:
+        """
+        Remove this node, so its shards move right away instead of when its
+        heartbeat expires.
+        """
+        connection = self.connect()
+        try:
+            connection.execute("DELETE FROM nodes WHERE node = ?", (self.node_id,))
+        finally:
+            connection.close()
+
+
+    def live_nodes(self, ttl: float) -> List[Dict[str, Any]]:
+        """
+        Nodes with a heartbeat in the last `ttl` seconds, dead ones are removed.
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute("DELETE FROM nodes WHERE last_seen < ?", (now - ttl * 10,))
+            rows = connection.execute("SELECT node, info, last_seen FROM nodes WHERE last_seen >= ? ORDER BY node", (now - ttl,)).fetchall()
+        finally:
+            connection.close()
+        return [{"node": row["node"], "last_seen": row["last_seen"], **json.loads(row["info"])} for row in rows]
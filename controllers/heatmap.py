@@ -0,0 +1,81 @@
+import os
+import cv2
+import numpy as np
+
+from typing import Optional, Tuple
+
+
+def get_heatmap_path(project: str) -> str:
+    return f"data/{project}/heatmap.bin"
+
+
+def open_heatmap(project: str, shape: Tuple[int, int], create: bool = False) -> Optional[np.memmap]:
+    """
+    Memory-map the grief counters of a project.
+
+    The file holds one little-endian uint32 per pixel of the cropped art,
+    row-major. Only the pages that are read or written are loaded.
+
+    Args:
+        project: The project name
+        shape: (height, width) of the cropped art
+        create: Create (or reset, if the art size changed) the file if needed
+
+    Returns:
+        The counters, or None if there are none yet
+    """
+    path = get_heatmap_path(project)
+    size = shape[0] * shape[1] * 4
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return np.memmap(path, dtype="<u4", mode="r+" if create else "r", shape=shape)
+    if not create:
+        return None
+    return np.memmap(path, dtype="<u4", mode="w+", shape=shape)
+
+
+def update_heatmap(project: str, mask: np.ndarray) -> None:
+    """
+    Add one to the counter of every changed pixel.
+
+    Args:
+        project: The project name
+        mask: Boolean array of changed pixels
+    """
+    changed = np.flatnonzero(mask)
+    if changed.size == 0:
+        return
+    counts = open_heatmap(project, mask.shape, create=True)
+    counts.reshape(-1)[changed] += 1
+    counts.flush()
+    del counts
+
+
+def render_heatmap(counts: np.ndarray, scale: int = 1) -> bytes:
+    """
+    Render grief counters as a colour-mapped PNG.
+
+    Pixels never changed are transparent, the rest go from dark (rarely
+    changed) to bright (most changed).
+
+    Args:
+        counts: The grief counters
+        scale: Integer upscaling factor, so small arts are visible
+
+    Returns:
+        The PNG file contents
+    """
+    counts = np.asarray(counts)
+    peak = int(counts.max()) if counts.size else 0
+    levels = np.zeros(counts.shape, dtype=np.uint8)
+    if peak > 0:
+        levels = (np.log1p(counts) * (255 / np.log1p(peak))).astype(np.uint8)
+
+    image = cv2.cvtColor(cv2.applyColorMap(levels, cv2.COLORMAP_INFERNO), cv2.COLOR_BGR2BGRA)
+    image[counts == 0, 3] = 0
+    if scale > 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+
+    ok, encoded = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Error: Could not encode the heatmap.")
+    return encoded.tobytes()
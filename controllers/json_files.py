@@ -0,0 +1,61 @@
+import os
+import json
+import tempfile
+
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# Advisory file locks: fcntl on POSIX, msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on `path`.lock, so the processes of this host
+    read-modify-write the file one at a time.
+
+    Args:
+        path: The file to lock (the lock file sits next to it)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a+") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_json(path: str, data: Any) -> None:
+    """
+    Write a JSON file atomically: to a temporary file in the same folder,
+    then renamed over the old one, so readers never see it half written.
+
+    Args:
+        path: The file to write
+        data: The data to serialize
+    """
+    folder = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+from typing import Dict
+
+from controllers.colors import PALETTE, UNKNOWN_COLOR, get_color_ids
+
+
+def snap_to_palette(image: np.ndarray) -> np.ndarray:
+    """
+    Get the color ids of an image, replacing colors outside the palette with
+    the nearest palette color (templates often come from screenshots or
+    resized exports).
+
+    Args:
+        image: BGRA array
+
+    Returns:
+        uint8 array of color ids
+    """
+    ids = get_color_ids(image)
+    unknown = ids == UNKNOWN_COLOR
+    if unknown.any():
+        colors, inverse = np.unique(image[unknown][:, [2, 1, 0]], axis=0, return_inverse=True)
+        distances = ((colors[:, None, :].astype(np.int32) - PALETTE[None, 1:, :3].astype(np.int32)) ** 2).sum(axis=2)
+        ids[unknown] = (np.argmin(distances, axis=1) + 1)[inverse.ravel()]
+    return ids
+
+
+def to_match_image(ids: np.ndarray) -> np.ndarray:
+    """
+    Render color ids as a 4 channel float image for matchTemplate, keeping
+    transparent pixels different from black.
+    """
+    return PALETTE[ids].astype(np.float32)
+
+
+def locate_art(tile: np.ndarray, template: np.ndarray) -> Dict:
+    """
+    Find where a template art is inside a tile.
+
+    Both images are reduced to palette colors and matched with a masked
+    squared difference (computed by OpenCV with FFTs for big templates).
+    Transparent pixels of the template can match anything.
+
+    Args:
+        tile: The tile as a BGRA array
+        template: The art as a BGRA array
+
+    Returns:
+        Dictionary with start_coords, end_coords (one pixel past the art, as
+        used by the projects) and confidence, the fraction of the template's
+        opaque pixels that match exactly.
+    """
+    if template.shape[0] > tile.shape[0] or template.shape[1] > tile.shape[1]:
+        raise ValueError("Error: The template is bigger than the tile.")
+
+    template_ids = snap_to_palette(template)
+    care = template[..., 3] >= 128
+    if not care.any():
+        raise ValueError("Error: The template is fully transparent.")
+    template_ids[~care] = 0
+
+    # Crop transparent borders so they don't constrain the position
+    rows = np.flatnonzero(care.any(axis=1))
+    cols = np.flatnonzero(care.any(axis=0))
+    template_ids = template_ids[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    care = care[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    # Tiles can hold off-palette colors too (old palettes, blended exports)
+    tile_ids = snap_to_palette(tile)
+    mask = np.repeat(care[..., None], 4, axis=2).astype(np.float32)
+    if care.all():
+        scores = cv2.matchTemplate(to_match_image(tile_ids), to_match_image(template_ids), cv2.TM_SQDIFF)
+    else:
+        scores = cv2.matchTemplate(to_match_image(tile_ids), to_match_image(template_ids), cv2.TM_SQDIFF, mask=mask)
+    scores[~np.isfinite(scores)] = np.inf
+    _, _, (x, y), _ = cv2.minMaxLoc(scores)
+
+    height, width = template_ids.shape
+    window = tile_ids[y:y + height, x:x + width]
+    confidence = float((window[care] == template_ids[care]).mean())
+
+    # Report the box of the whole template, transparent borders included
+    start_x, start_y = max(x - cols[0], 0), max(y - rows[0], 0)
+    return {
+        "start_coords": {"x": int(start_x), "y": int(start_y)},
+        "end_coords": {"x": int(start_x + template.shape[1]), "y": int(start_y + template.shape[0])},
+        "confidence": round(confidence, 4),
+    }
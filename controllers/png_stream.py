@@ -0,0 +1,148 @@
+import zlib
+import struct
+
+from typing import List, Optional
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def make_chunk(chunk_type: bytes, data) -> List:
+    """
+    The pieces of a PNG chunk, to be joined with the rest of the file.
+    """
+    return [struct.pack(">I", len(data)) + chunk_type, data, struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)))]
+
+
+class PngRowReader:
+    """
+    Reads a PNG as it downloads and stops once the first `rows` scanlines are
+    inflated, without unfiltering or decoding anything.
+
+    The result is a valid PNG with only those rows (same header chunks, the
+    raw scanlines stored uncompressed), so it can be decoded and cropped like
+    the whole tile. If every row is needed, or the image is interlaced and
+    can't be cut, the file is read entirely and returned as is.
+    """
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.buffer = bytearray()
+        self.signature = False
+        self.header: List[bytes] = []   # Chunks before the image data
+        self.ihdr: Optional[bytes] = None
+        self.needed = None              # Inflated bytes for the wanted rows
+        self.cut = False                # Whether the image is cut at all
+        self.inflater = zlib.decompressobj()
+        self.raw = bytearray()
+        self.idat_left = 0              # Bytes of the current IDAT chunk not read yet
+        self.skip = 0                   # Bytes of its CRC not read yet
+        self.done = False
+        self.whole = bytearray()        # Everything read, the compressed file is small
+
+
+    def feed(self, data: bytes) -> bool:
+        """
+        Add downloaded bytes.
+
+        Returns:
+            bool: True once the wanted rows are there and the rest of the
+            download can be dropped
+        """
+        if self.done:
+            return True
+        self.whole += data
+        self.buffer += data
+
+        if not self.signature:
+            if len(self.buffer) < len(PNG_SIGNATURE):
+                return False
+            if bytes(self.buffer[:len(PNG_SIGNATURE)]) != PNG_SIGNATURE:
+                raise ValueError("Error: Not a PNG file.")
+            del self.buffer[:len(PNG_SIGNATURE)]
+            self.signature = True
+
+        while not self.done:
+            if self.idat_left:
+                # Image data is inflated as it arrives, no need for the whole chunk
+                data = bytes(self.buffer[:self.idat_left])
+                del self.buffer[:len(data)]
+                self.idat_left -= len(data)
+                if self.cut:
+                    self.inflate(data)
+                if self.idat_left:
+                    return self.done
+            if self.skip:
+                # CRC of the image data chunk
+                skipped = min(self.skip, len(self.buffer))
+                del self.buffer[:skipped]
+                self.skip -= skipped
+                if self.skip:
+                    return False
+
+            if len(self.buffer) < 8:
+                return False
+            length, chunk_type = struct.unpack(">I4s", bytes(self.buffer[:8]))
+            if chunk_type == b"IDAT":
+                if self.ihdr is None:
+                    raise ValueError("Error: PNG image data before the header.")
+                del self.buffer[:8]
+                self.idat_left = length
+                self.skip = 4
+                continue
+
+            if len(self.buffer) < length + 12:
+                return False
+            chunk = bytes(self.buffer[:length + 12])
+            del self.buffer[:length + 12]
+            if chunk_type == b"IHDR":
+                self.read_header(chunk[8:8 + length])
+            elif chunk_type == b"IEND":
+                self.done = True
+            elif self.ihdr is not None and not self.raw:
+                self.header.append(chunk)
+        return self.done
+
+
+    def read_header(self, data: bytes) -> None:
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+        if color_type not in CHANNELS:
+            raise ValueError(f"Error: Unknown PNG color type {color_type}.")
+        self.ihdr = data
+        self.rows = max(0, min(self.rows, height))
+        self.cut = interlace == 0 and self.rows < height
+        stride = (width * CHANNELS[color_type] * bit_depth + 7) // 8
+        self.needed = self.rows * (stride + 1)
+
+
+    def inflate(self, data: bytes) -> None:
+        left = self.needed - len(self.raw)
+        if left > 0:
+            self.raw += self.inflater.decompress(data, left)
+        if len(self.raw) >= self.needed:
+            self.done = True
+
+
+    def png(self) -> bytes:
+        """
+        The PNG with only the wanted rows, or the whole file if it was not cut.
+        """
+        if self.ihdr is None:
+            raise ValueError("Error: Incomplete PNG file.")
+        if not self.cut:
+            if not self.done:
+                raise ValueError("Error: Incomplete PNG file.")
+            return bytes(self.whole)
+        if len(self.raw) < self.needed:
+            raise ValueError("Error: Incomplete PNG image data.")
+
+        ihdr = self.ihdr[:4] + struct.pack(">I", self.rows) + self.ihdr[8:]
+        return b"".join([
+            PNG_SIGNATURE,
+            *make_chunk(b"IHDR", ihdr),
+            *self.header,
+            *make_chunk(b"IDAT", zlib.compress(memoryview(self.raw)[:self.needed], 0)),
+            *make_chunk(b"IEND", b""),
+        ])
+
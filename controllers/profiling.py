@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+
+from typing import Callable, Dict, List, Optional
+
+
+class CheckProfiler:
+    """
+    Profiles the next N check_change calls ("check" scope) or check cycles
+    ("cycle" scope, a whole check_pipeline run) of a WPlace instance.
+
+    While armed, the method is replaced by a profiling wrapper on the
+    instance; once the N calls are done the wrapper is removed, so there is
+    no cost at all while disabled. In cycle scope the download thread of the
+    pipeline is profiled too, through the target's thread_hook.
+    """
+
+    SCOPES = {"check": "check_change", "cycle": "check_pipeline"}
+    MODES = ("deterministic", "sampling")
+
+    def __init__(self, target, output_dir: str = "data/profiles"):
+        self.target = target
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.method = None
+        self.remaining = 0
+        self.mode = None
+        self.scope = None
+        self.interval = 0.005
+        self.trace_memory = False
+        self.active = False
+        self.profile = None
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.sampled_threads: Dict[int, str] = {}   # Thread id -> name
+        self.samples: Dict[str, List[List[int]]] = {}
+        self.frames: Dict[tuple, int] = {}
+        self.started = None
+        self.files: List[str] = []
+        self.top_allocations: List[str] = []
+
+
+    def arm(self, calls: int, mode: str = "deterministic", scope: str = "check", trace_memory: bool = False, interval: float = 0.005) -> None:
+        """
+        Profile the next `calls` calls.
+
+        Args:
+            calls: Number of calls to profile
+            mode: "deterministic" (cProfile, saved as pstats) or "sampling"
+                (stack samples every `interval` seconds, saved as speedscope JSON)
+            scope: "check" for check_change calls, "cycle" for check cycles
+            trace_memory: Also save a tracemalloc snapshot at the end
+            interval: Seconds between samples in sampling mode
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Error: Unknown profiling mode {mode}.")
+        if scope not in self.SCOPES:
+            raise ValueError(f"Error: Unknown profiling scope {scope}.")
+        if calls < 1:
+            raise ValueError("Error: At least one call must be profiled.")
+
+        with self.lock:
+            if self.method is not None:
+                raise ValueError("Error: The profiler is already armed.")
+            self.remaining = calls
+            self.mode = mode
+            self.scope = scope
+            self.trace_memory = trace_memory
+            self.interval = max(interval, 0.001)
+            self.profile = cProfile.Profile() if mode == "deterministic" else None
+            self.thread_profiles = []
+            self.sampled_threads = {}
+            self.samples = {}
+            self.frames = {}
+            self.started = None
+            self.method = self.SCOPES[scope]
+
+            original = getattr(self.target, self.method)
+            wrapper = self.wrap_cycle(original) if scope == "cycle" else self.wrap_check(original)
+            setattr(self.target, self.method, wrapper)
+
+
+    def disarm(self) -> Optional[List[str]]:
+        """
+        Stop profiling and save what was collected so far.
+
+        Returns:
+            The files written
+        """
+        with self.lock:
+            if self.method is None:
+                return None
+            # Back to the class method
+            self.target.__dict__.pop(self.method, None)
+            self.method = None
+            self.remaining = 0
+            if self.active:
+                # Saved when the running call ends
+                return []
+            return self.save()
+
+
+    def status(self) -> Dict:
+        return {
+            "armed": self.method is not None,
+            "remaining": self.remaining,
+            "mode": self.mode,
+            "scope": self.scope,
+            "trace_memory": self.trace_memory,
+            "files": [os.path.basename(file) for file in self.files],
+            "top_allocations": self.top_allocations,
+        }
+
+
+    def wrap_check(self, original):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if not self.begin():
+                return original(*args, **kwargs)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.end()
+        return wrapper
+
+
+    def wrap_cycle(self, original):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if not self.begin():
+                yield from original(*args, **kwargs)
+                return
+            try:
+                yield from original(*args, **kwargs)
+            finally:
+                self.end()
+        return wrapper
+
+
+    def wrap_thread(self, target: Callable) -> Callable:
+        """
+        Profile a thread started during a profiled cycle.
+        """
+        @functools.wraps(target)
+        def wrapper(*args, **kwargs):
+            if self.profile is not None:
+                profile = cProfile.Profile()
+                with self.lock:
+                    self.thread_profiles.append(profile)
+                profile.enable()
+                try:
+                    return target(*args, **kwargs)
+                finally:
+                    profile.disable()
+
+            ident = threading.get_ident()
+            self.sampled_threads[ident] = target.__name__
+            try:
+                return target(*args, **kwargs)
+            finally:
+                self.sampled_threads.pop(ident, None)
+        return wrapper
+
+
+    def begin(self) -> bool:
+        """
+        Start profiling a call, unless another one is being profiled.
+        """
+        with self.lock:
+            if self.active or self.remaining <= 0:
+                return False
+            self.active = True
+            if self.started is None:
+                self.started = time.time()
+                if self.trace_memory and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+
+        if self.scope == "cycle":
+            self.target.thread_hook = self.wrap_thread
+        if self.profile is not None:
+            self.profile.enable()
+        else:
+            self.sampled_threads[threading.get_ident()] = "checks"
+            self.sampling = threading.Event()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+        return True
+
+
+    def end(self) -> None:
+        # The pipeline joined its threads before returning
+        self.target.thread_hook = None
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            self.sampling.set()
+            self.sampler.join()
+            self.sampled_threads.clear()
+
+        with self.lock:
+            self.active = False
+            self.remaining = max(self.remaining - 1, 0)
+            if self.remaining > 0:
+                return
+            if self.method is not None:
+                self.target.__dict__.pop(self.method, None)
+                self.method = None
+            self.save()
+
+
+    def sample(self) -> None:
+        """
+        Collect the stacks of the profiled threads every interval.
+        """
+        while not self.sampling.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, name in list(self.sampled_threads.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_name, code.co_filename, code.co_firstlineno)
+                    if key not in self.frames:
+                        self.frames[key] = len(self.frames)
+                    stack.append(self.frames[key])
+                    frame = frame.f_back
+                if stack:
+                    self.samples.setdefault(name, []).append(stack[::-1])
+
+
+    def save(self) -> List[str]:
+        """
+        Write the collected profile (and memory snapshot) to the output folder.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{self.output_dir}/{time.strftime('%Y%m%d_%H%M%S')}_{self.scope}"
+        files = []
+
+        if self.profile is not None:
+            # One profile per thread, merged into one file
+            stats = pstats.Stats(self.profile)
+            for profile in self.thread_profiles:
+                stats.add(profile)
+            stats.dump_stats(f"{name}.pstats")
+            files.append(f"{name}.pstats")
+        elif self.samples:
+            frames = sorted(self.frames, key=self.frames.get)
+            with open(f"{name}.speedscope.json", "w") as f:
+                json.dump({
+                    "$schema": "https://www.speedscope.app/file-format-schema.json",
+                    "shared": {"frames": [{"name": n, "file": file, "line": line} for n, file, line in frames]},
+                    # One profile per thread
+                    "profiles": [{
+                        "type": "sampled",
+                        "name": f"{self.scope} {thread} ({len(samples)} samples)",
+                        "unit": "seconds",
+                        "startValue": 0,
+                        "endValue": len(samples) * self.interval,
+                        "samples": samples,
+                        "weights": [self.interval] * len(samples),
+                    } for thread, samples in self.samples.items()],
+                    "exporter": "wplace-alerter",
+                }, f)
+            files.append(f"{name}.speedscope.json")
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot.dump(f"{name}.tracemalloc")
+            files.append(f"{name}.tracemalloc")
+            self.top_allocations = [str(stat) for stat in snapshot.statistics("lineno")[:10]]
+
+        self.profile = None
+        self.files = files + self.files
+        return files
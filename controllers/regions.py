@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+from typing import Dict, List, Tuple
+
+from controllers.colors import Color, UNKNOWN_COLOR, get_color_ids
+
+
+def summarize_regions(mask: np.ndarray, new: np.ndarray, offset: Tuple[int, int] = (0, 0)) -> List[Dict]:
+    """
+    Group changed pixels into 8-connected regions.
+
+    Args:
+        mask: Boolean array of changed pixels
+        new: New BGRA image
+        offset: (x, y) added to the coordinates, to report them in tile space
+
+    Returns:
+        One dictionary per region, biggest first, with its bounding box
+        (start/end, end included), pixel count and dominant new color.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    if count <= 1:
+        return []
+
+    # Count (region, new color) pairs in one pass to get the dominant colors
+    ys, xs = np.nonzero(mask)
+    keys = labels[ys, xs].astype(np.int64) * 256 + get_color_ids(new)[ys, xs]
+    dominant = np.bincount(keys, minlength=count * 256).reshape(count, 256).argmax(axis=1)
+
+    colors = list(Color)
+    regions = []
+    for label in np.argsort(-stats[1:, cv2.CC_STAT_AREA]) + 1:
+        x, y, width, height, pixels = stats[label].tolist()
+        color_id = int(dominant[label])
+        regions.append({
+            "start": (offset[0] + x, offset[1] + y),
+            "end": (offset[0] + x + width - 1, offset[1] + y + height - 1),
+            "pixels": pixels,
+            "color_id": color_id if color_id != UNKNOWN_COLOR else None,
+            "color_name": colors[color_id].name if color_id != UNKNOWN_COLOR else "UNKNOWN",
+        })
+    return regions
+
+
+def format_region(region: Dict) -> str:
+    """
+    One line description of a region.
+    """
+    (x0, y0), (x1, y1) = region["start"], region["end"]
+    x = f"{x0}" if x0 == x1 else f"{x0}-{x1}"
+    y = f"{y0}" if y0 == y1 else f"{y0}-{y1}"
+    return f"X={x}, Y={y}: {region['pixels']} pixels, mostly {region['color_name']}(id: {region['color_id']})"
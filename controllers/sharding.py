@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+
+from typing import Dict, Iterable, List, Optional
+
+from controllers.tile_sources import get_tile_key
+
+
+def get_shard_key(api_image: str) -> str:
+    """
+    Key used to place a project on a node: its tile coordinates, so every art
+    on a tile lands on the same node and shares one download.
+    """
+    try:
+        tile_x, tile_y = get_tile_key(api_image)
+        return f"{tile_x},{tile_y}"
+    except ValueError:
+        return api_image
+
+
+class HashRing:
+    """
+    Consistent hashing ring. Each node gets `replicas` points on the ring and
+    a key belongs to the first node point after its hash, so when a node joins
+    or leaves only the keys next to its points move.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 64):
+        self.nodes = sorted(set(nodes))
+        self.points: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for node in self.nodes:
+            for i in range(replicas):
+                point = self.hash(f"{node}#{i}")
+                self.owners[point] = node
+                self.points.append(point)
+        self.points.sort()
+
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+    def owner(self, key: str) -> Optional[str]:
+        """
+        The node a key belongs to, or None if the ring is empty.
+        """
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
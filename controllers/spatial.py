@@ -0,0 +1,155 @@
+import threading
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from controllers.tile_sources import get_tile_key
+
+
+TILE_SIZE = 1000
+
+Box = Tuple[int, int, int, int]
+
+
+def get_world_box(art: dict) -> Optional[Box]:
+    """
+    World pixel box of an art: its tile coordinates times the tile size plus
+    its coordinates in the tile.
+
+    Args:
+        art: The art dictionary from arts.json
+
+    Returns:
+        (x0, y0, x1, y1) with x1 and y1 excluded, or None if the tile URL is invalid
+    """
+    try:
+        tile_x, tile_y = get_tile_key(art["api_image"])
+    except ValueError:
+        return None
+    return (
+        tile_x * TILE_SIZE + art["start_coords"]["x"], tile_y * TILE_SIZE + art["start_coords"]["y"],
+        tile_x * TILE_SIZE + art["end_coords"]["x"], tile_y * TILE_SIZE + art["end_coords"]["y"]
+    )
+
+
+def boxes_intersect(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class SpatialIndex:
+    """
+    Uniform grid over world coordinates. Every art is registered in the
+    cells its box touches, so a query only looks at the arts of the cells it
+    covers instead of every project.
+    """
+
+    def __init__(self, cell_size: int = 250):
+        self.cell_size = cell_size
+        self.lock = threading.Lock()
+        self.boxes: Dict[str, Box] = {}
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+
+
+    def get_cell_range(self, box: Box) -> Box:
+        """
+        First and last cell (both included) a box touches on each axis.
+        """
+        x0, y0, x1, y1 = box
+        return (
+            x0 // self.cell_size, y0 // self.cell_size,
+            (max(x1, x0 + 1) - 1) // self.cell_size, (max(y1, y0 + 1) - 1) // self.cell_size
+        )
+
+
+    def get_cells(self, box: Box) -> List[Tuple[int, int]]:
+        cell_x0, cell_y0, cell_x1, cell_y1 = self.get_cell_range(box)
+        return [
+            (cell_x, cell_y)
+            for cell_x in range(cell_x0, cell_x1 + 1)
+            for cell_y in range(cell_y0, cell_y1 + 1)
+        ]
+
+
+    def rebuild(self, arts: Dict[str, dict]) -> None:
+        with self.lock:
+            self.boxes.clear()
+            self.cells.clear()
+        for name, art in arts.items():
+            self.add(name, art)
+
+
+    def add(self, name: str, art: dict) -> None:
+        """
+        Register an art, replacing its previous location if it was indexed.
+        """
+        self.remove(name)
+        box = get_world_box(art)
+        if box is None:
+            return
+        with self.lock:
+            self.boxes[name] = box
+            for cell in self.get_cells(box):
+                self.cells.setdefault(cell, set()).add(name)
+
+
+    def remove(self, name: str) -> None:
+        with self.lock:
+            box = self.boxes.pop(name, None)
+            if box is None:
+                return
+            for cell in self.get_cells(box):
+                names = self.cells.get(cell)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self.cells[cell]
+
+
+    def get_box(self, name: str) -> Optional[Box]:
+        return self.boxes.get(name)
+
+
+    def query(self, box: Box) -> List[str]:
+        """
+        Names of the arts intersecting a world box, sorted.
+        """
+        with self.lock:
+            candidates = set()
+            cell_x0, cell_y0, cell_x1, cell_y1 = self.get_cell_range(box)
+            if (cell_x1 - cell_x0 + 1) * (cell_y1 - cell_y0 + 1) > len(self.cells):
+                # Huge box: walk the populated cells instead of every cell it covers
+                for (cell_x, cell_y), names in self.cells.items():
+                    if cell_x0 <= cell_x <= cell_x1 and cell_y0 <= cell_y <= cell_y1:
+                        candidates |= names
+            else:
+                for cell in self.get_cells(box):
+                    candidates |= self.cells.get(cell, set())
+            return sorted(name for name in candidates if boxes_intersect(self.boxes[name], box))
+
+
+    def at(self, x: int, y: int) -> List[str]:
+        """
+        Names of the arts covering the world pixel (x, y).
+        """
+        return self.query((x, y, x + 1, y + 1))
+
+
+    def in_tile(self, tile_x: int, tile_y: int) -> List[str]:
+        """
+        Names of the arts on a tile, the ones to check when it changes.
+        """
+        return self.query((tile_x * TILE_SIZE, tile_y * TILE_SIZE, (tile_x + 1) * TILE_SIZE, (tile_y + 1) * TILE_SIZE))
+
+
+    def overlaps(self) -> List[Tuple[str, str]]:
+        """
+        Every pair of arts whose boxes intersect.
+        """
+        with self.lock:
+            pairs = set()
+            for names in self.cells.values():
+                ordered = sorted(names)
+                for i, a in enumerate(ordered):
+                    for b in ordered[i + 1:]:
+                        if boxes_intersect(self.boxes[a], self.boxes[b]):
+                            pairs.add((a, b))
+            return sorted(pairs)
@@ -0,0 +1,140 @@
+import os
+import re
+import bisect
+import requests
+
+from typing import Dict, List, Tuple
+
+from controllers.png_stream import PngRowReader
+
+
+def get_tile_key(url: str) -> Tuple[int, int]:
+    """
+    Get the (x, y) tile coordinates from a tile URL, whatever the host.
+    """
+    match = re.search(r'/(\d+)/(\d+)\.png$', url)
+    if not match:
+        raise ValueError(f"Error: Invalid tile URL {url}")
+    return (int(match.group(1)), int(match.group(2)))
+
+
+class HttpTileSource:
+    """
+    Downloads the tiles from their URL.
+    """
+
+    def __init__(self, session: requests.Session, timeout: float = 10, drain_limit: int = 1 << 20):
+        self.session = session
+        self.timeout = timeout
+        # Bytes left in a partial download below which it is read to the end
+        self.drain_limit = drain_limit
+
+    def fetch(self, url: str) -> bytes:
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def fetch_rows(self, url: str, rows: int) -> bytes:
+        """
+        Download a tile but only inflate it until its first `rows` rows can
+        be decoded.
+
+        The rest of the body is still read when it is small, as dropping it
+        closes the keep-alive connection and a new TLS handshake costs more
+        than the bytes saved.
+
+        Returns:
+            A PNG with only those rows
+        """
+        reader = PngRowReader(rows)
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(16384)
+            for chunk in chunks:
+                if reader.feed(chunk):
+                    break
+            length = response.headers.get("Content-Length")
+            if length is None or not length.isdigit() or int(length) - response.raw.tell() <= self.drain_limit:
+                for _ in chunks:
+                    pass
+        return reader.png()
+
+
+class MemoryTileSource:
+    """
+    Serves tiles kept in memory, keyed by tile coordinates.
+    """
+
+    def __init__(self, tiles: Dict[Tuple[int, int], bytes] = None):
+        self.tiles = dict(tiles or {})
+
+    def set(self, tile: Tuple[int, int], data: bytes) -> None:
+        self.tiles[tile] = data
+
+    def fetch(self, url: str) -> bytes:
+        tile = get_tile_key(url)
+        if tile not in self.tiles:
+            raise FileNotFoundError(f"Error: No tile {tile[0]},{tile[1]} in memory.")
+        return self.tiles[tile]
+
+
+class DirectoryTileSource:
+    """
+    Serves recorded tiles from a directory laid out as
+    <root>/<tile_x>/<tile_y>/<unix timestamp>.png.
+
+    fetch returns the last recording at or before the current time, set
+    with seek.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.time = float("inf")
+        self.recordings: Dict[Tuple[int, int], Tuple[List[float], List[str]]] = {}
+
+        for tile_x in os.listdir(root):
+            if not tile_x.isdigit() or not os.path.isdir(os.path.join(root, tile_x)):
+                continue
+            for tile_y in os.listdir(os.path.join(root, tile_x)):
+                folder = os.path.join(root, tile_x, tile_y)
+                if not tile_y.isdigit() or not os.path.isdir(folder):
+                    continue
+                frames = []
+                for file in os.listdir(folder):
+                    stem, ext = os.path.splitext(file)
+                    try:
+                        if ext.lower() == ".png":
+                            frames.append((float(stem), os.path.join(folder, file)))
+                    except ValueError:
+                        continue
+                frames.sort()
+                self.recordings[(int(tile_x), int(tile_y))] = ([t for t, _ in frames], [p for _, p in frames])
+
+    def timestamps(self) -> List[float]:
+        """
+        Every recorded timestamp, in order.
+        """
+        return sorted({t for times, _ in self.recordings.values() for t in times})
+
+    def tiles_at(self, timestamp: float) -> List[Tuple[int, int]]:
+        """
+        Tiles with a recording exactly at timestamp.
+        """
+        found = []
+        for tile, (times, _) in self.recordings.items():
+            i = bisect.bisect_left(times, timestamp)
+            if i < len(times) and times[i] == timestamp:
+                found.append(tile)
+        return found
+
+    def seek(self, timestamp: float) -> None:
+        self.time = timestamp
+
+    def fetch(self, url: str) -> bytes:
+        tile = get_tile_key(url)
+        times, paths = self.recordings.get(tile, ([], []))
+        i = bisect.bisect_right(times, self.time) - 1
+        if i < 0:
+            raise FileNotFoundError(f"Error: No recording of tile {tile[0]},{tile[1]} at {self.time}.")
+        with open(paths[i], "rb") as f:
+            return f.read()
@@ -0,0 +1,170 @@
+import os
+import zlib
+import struct
+import numpy as np
+
+from PIL import Image, GifImagePlugin
+from typing import Iterator, Optional, Tuple
+
+from controllers.colors import PALETTE, UNKNOWN_COLOR, get_color_ids
+
+
+# Frame record: timestamp, kind, height, width, payload length
+FRAME_HEADER = struct.Struct("<dBHHI")
+# Last frame sidecar: height, width, frames since the last key frame
+LAST_HEADER = struct.Struct("<HHI")
+
+KEY_FRAME = 0
+DELTA_FRAME = 1
+KEY_FRAME_INTERVAL = 100
+
+# GIF palette: the wplace colors, magenta for unknown colors, padded to 128
+GIF_UNKNOWN_INDEX = len(PALETTE)
+GIF_PALETTE = np.zeros((128, 3), dtype=np.uint8)
+GIF_PALETTE[:len(PALETTE)] = PALETTE[:, :3]
+GIF_PALETTE[GIF_UNKNOWN_INDEX] = (255, 0, 255)
+
+
+def get_frames_path(project: str) -> str:
+    return f"data/{project}/frames.bin"
+
+
+def get_last_frame_path(project: str) -> str:
+    return f"data/{project}/frames.last"
+
+
+def read_last_frame(project: str) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Read the last appended frame of a project.
+
+    Returns:
+        (color ids, frames since the last key frame), or (None, 0)
+    """
+    path = get_last_frame_path(project)
+    if not os.path.exists(path) or not os.path.exists(get_frames_path(project)):
+        return None, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    height, width, since_key = LAST_HEADER.unpack_from(data)
+    frame = np.frombuffer(data, dtype=np.uint8, offset=LAST_HEADER.size)
+    if frame.size != height * width:
+        return None, 0
+    return frame.reshape(height, width), since_key
+
+
+def append_frame(project: str, image: np.ndarray, timestamp: float) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """
+    Append a palette-indexed frame to the frame log of a project.
+
+    Frames are stored as zlib-compressed color ids. Every KEY_FRAME_INTERVAL
+    frames a key frame is written, the rest are XOR deltas against the
+    previous frame, which compress to almost nothing when little changed.
+    If the art size changed, the log starts over.
+
+    Args:
+        project: The project name
+        image: The cropped art as a BGRA array
+        timestamp: Unix time of the frame
+
+    Returns:
+        (color ids of the previous frame or None, color ids of this frame)
+    """
+    frame = get_color_ids(image)
+    previous, since_key = read_last_frame(project)
+
+    mode = "ab"
+    if previous is None or previous.shape != frame.shape:
+        mode = "wb"
+        kind, payload, since_key = KEY_FRAME, frame, 0
+    elif since_key + 1 >= KEY_FRAME_INTERVAL:
+        kind, payload, since_key = KEY_FRAME, frame, 0
+    else:
+        kind, payload, since_key = DELTA_FRAME, frame ^ previous, since_key + 1
+
+    compressed = zlib.compress(payload.tobytes(), 6)
+    with open(get_frames_path(project), mode) as f:
+        f.write(FRAME_HEADER.pack(timestamp, kind, frame.shape[0], frame.shape[1], len(compressed)))
+        f.write(compressed)
+
+    with open(get_last_frame_path(project), "wb") as f:
+        f.write(LAST_HEADER.pack(frame.shape[0], frame.shape[1], since_key))
+        f.write(frame.tobytes())
+    return previous, frame
+
+
+def iter_frames(project: str) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Read the frame log of a project one frame at a time.
+
+    Yields:
+        (timestamp, color ids) of every frame, in order
+    """
+    path = get_frames_path(project)
+    if not os.path.exists(path):
+        return
+
+    frame = None
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            timestamp, kind, height, width, length = FRAME_HEADER.unpack(header)
+            compressed = f.read(length)
+            if len(compressed) < length:
+                break  # Truncated record, probably being written
+
+            payload = np.frombuffer(zlib.decompress(compressed), dtype=np.uint8).reshape(height, width)
+            if kind == KEY_FRAME or frame is None or frame.shape != payload.shape:
+                frame = payload
+            else:
+                frame = frame ^ payload
+            yield timestamp, frame
+
+
+def to_gif_indices(frame: np.ndarray) -> np.ndarray:
+    indices = frame.copy()
+    indices[indices == UNKNOWN_COLOR] = GIF_UNKNOWN_INDEX
+    return indices
+
+
+def stream_gif(frames: Iterator[Tuple[float, np.ndarray]], fps: float = 10, scale: int = 1, step: int = 1) -> Iterator[bytes]:
+    """
+    Encode frames as an animated GIF, one frame at a time.
+
+    Only the current frame is kept in memory, so the length of the
+    time-lapse does not matter.
+
+    Args:
+        frames: (timestamp, color ids) frames, as returned by iter_frames
+        fps: Frames per second of the animation
+        scale: Integer upscaling factor
+        step: Keep one frame out of every `step`
+
+    Yields:
+        Chunks of the GIF file
+    """
+    duration = max(int(1000 / fps), 20)
+    size = None
+    for i, (_, frame) in enumerate(frames):
+        if i % step:
+            continue
+        image = Image.fromarray(to_gif_indices(frame), "P")
+        if scale > 1:
+            image = image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+        image.putpalette(GIF_PALETTE.tobytes())
+
+        if size is None:
+            size = image.size
+            yield (
+                b"GIF89a" + struct.pack("<HHBBB", size[0], size[1], 0xF6, 0, 0) + GIF_PALETTE.tobytes()
+                # Loop forever
+                + b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", 0) + b"\x00"
+            )
+        elif image.size != size:
+            continue
+
+        yield b"".join(GifImagePlugin.getdata(image, duration=duration, transparency=0, disposal=2))
+
+    if size is not None:
+        yield b";"
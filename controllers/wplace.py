@@ -3,24 +3,36 @@ import re
 import cv2
 import json
 import time
+import queue
 import base64
+import threading
 import requests
 import numpy as np
 
 from PIL import Image
+from io import BytesIO
 from textwrap import dedent
 from colorama import Fore, init
 from deprecated import deprecated
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator, Callable
 from pydantic import BaseModel, Field
 
 from controllers.colors import get_color_id
+from controllers.command_codec import JS_DECODER, encode_pixels
+from controllers.heatmap import update_heatmap
+from controllers.json_files import file_lock, write_json
+from controllers.regions import summarize_regions, format_region
+from controllers.tile_sources import HttpTileSource
+from controllers.timelapse import append_frame
 
 init(autoreset=True)
 
 
 Pixel = Dict[str, Dict[str, int]]
 
+# Arts ending above this row are downloaded and decoded only up to their last row
+PARTIAL_TILE_ROWS = 500
+
 class Position(BaseModel):
     x: int = Field(..., ge=0)
     y: int = Field(..., ge=0)
@@ -34,14 +46,37 @@ class WPlaceArtInterface(BaseModel):
     api_image: str = Field(..., pattern=r'^https://backend\.wplace\.live/files/s0/tiles/\d+/\d+\.png$') # ^https://backend\.wplace\.live/tile/\d+/\d+\.png$
     start_coords: Position
     end_coords: Position
+    min_changed_pixels: int = Field(1, ge=1)
+
+class IgnoreRegionInterface(BaseModel):
+    start_coords: Position
+    end_coords: Position
 
 
 class WPlace:
 
-    def __init__(self, arts_data: Dict):
+    CHECKED_SAVE_INTERVAL = 5
+
+    def __init__(self, arts_data: Dict, tile_source=None):
         self.session = requests.Session()
         self.timeout = 10
         self.arts_data = arts_data
+        self.tile_source = tile_source or HttpTileSource(self.session, self.timeout)
+        # If set, webhook messages are passed to it as (payload, files) instead of being posted
+        self.alert_sink: Optional[Callable[[dict, dict], None]] = None
+        # If set, wraps the target of the threads check_pipeline starts (used to profile them)
+        self.thread_hook: Optional[Callable[[Callable], Callable]] = None
+        self.alerts_lock = threading.Lock()
+        self.pending_alerts: Dict[str, Dict] = {}
+        self.pending_since = 0.0
+        # Per project: last snapshot and currently changed pixels, see check_change
+        self.grief_states: Dict[str, Dict] = {}
+        # Checked fields waiting to be written to arts.json. While a pipeline
+        # runs they are written at most every CHECKED_SAVE_INTERVAL seconds
+        self.checked_lock = threading.Lock()
+        self.pending_checked: Dict[str, Dict] = {}
+        self.pipelines = 0
+        self.checked_saved_at = 0.0
 
     
     def __del__(self):
@@ -83,9 +118,9 @@ class WPlace:
 
         # Compact data structure: only essential info
         compact_data = []
-        skip_logs = ""
+        unknown_skipped = 0
+        paid_skipped: Dict[int, int] = {}
 
-        counter = 1
         for pixel in pixels:
             # Pixel absolute position
             abs_x = coords[0] + pixel['x']
@@ -98,17 +133,29 @@ class WPlace:
             # Avoid paid color pixels
             if color_idx == None:
                 if pixel["old_color"][3] != 0:
-                    skip_logs += f"⚠️ Skipping pixel {counter}/{len(pixels)}: {pixel} for being an unknown color\n"
-                counter += 1
+                    unknown_skipped += 1
                 continue
             elif not owned:
-                skip_logs += f"⚠️ Skipping pixel {counter}/{len(pixels)}: {pixel} for being a paid color ({color_idx})\n"
-                counter += 1
+                paid_skipped[color_idx] = paid_skipped.get(color_idx, 0) + 1
                 continue
 
             # Store only: [x, y, r, g, b, a, colorIdx]
             compact_data.append([abs_x, abs_y, r, g, b, a, color_idx])
-            counter += 1
+
+        # One line per reason instead of one per pixel
+        skip_logs = ""
+        if unknown_skipped:
+            skip_logs += f"⚠️ Skipping {unknown_skipped}/{len(pixels)} pixels for being an unknown color\n"
+        for color_idx, skipped in sorted(paid_skipped.items()):
+            skip_logs += f"⚠️ Skipping {skipped}/{len(pixels)} pixels for being a paid color ({color_idx})\n"
+
+        # Pixel data, optionally packed (delta-coded coordinates + color id, base64)
+        compact = self.arts_data.get("compact_commands", False)
+        if compact:
+            encoded, palette = encode_pixels(compact_data)
+            pixel_data = f'decodePixels("{encoded}", {json.dumps(palette, separators=(",", ":"))})'
+        else:
+            pixel_data = json.dumps(compact_data)
 
         # Generate the JS file with data + reconstruction code
         js_content = dedent(f"""
@@ -122,7 +169,7 @@ class WPlace:
                     zoom: 14
                 }})
             }}
-            const pixelData = {json.dumps(compact_data)};
+            const pixelData = {pixel_data};
             const tiles = {json.dumps(api_tiles)};
             const t0 = tiles[0];
             const t1 = tiles[1];
@@ -143,6 +190,8 @@ class WPlace:
                 document.querySelector('button.btn-lg.relative').click();
             }}, 3000);
         """).strip()
+        if compact:
+            js_content = JS_DECODER + "\n" + js_content
 
         # Read last command to compare if exists
         same_command = False
@@ -172,88 +221,309 @@ class WPlace:
         cropped_image.save(image_path)
 
     
-    def compare_image(self, path: str, threshold: float = 0.0) -> bool:
+    def load_images(self, path: str) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Compares two images and returns True if they are similar within a certain threshold.
+        Load the original and new images of a project as BGRA arrays.
 
         Args:
             path: Base path for the images
-            threshold: Similarity threshold (lower is more strict)
 
         Returns:
-            bool: True if images are similar, False otherwise
+            (original, new) images with shape (height, width, 4)
         """
         # Load images with alpha channel to consider transparency differences
-        new = cv2.imread(f"{path}new.png", cv2.IMREAD_UNCHANGED)
         original = cv2.imread(f"{path}original.png", cv2.IMREAD_UNCHANGED)
+        new = cv2.imread(f"{path}new.png", cv2.IMREAD_UNCHANGED)
 
         # Check if images are loaded successfully
         if original is None or new is None:
             print(Fore.LIGHTRED_EX + "Error: Could not read one or more image files.")
             raise ValueError("Error: Could not read one or more image files.")
-        
+
         # Check if original and new have the same dimensions
-        if original.shape != new.shape:
+        if original.shape[:2] != new.shape[:2]:
             print(Fore.LIGHTRED_EX + "Error: Images have different dimensions.")
             raise ValueError(f"Error: Images have different dimensions. Original dimensions: {original.shape[1]}x{original.shape[0]}, New dimensions: {new.shape[1]}x{new.shape[0]}")
 
-        # Calculate the MSE (Mean Squared Error) between original and new to check if pixels changed
-        diff = original.astype("float") - new.astype("float")
-        err = np.mean(diff ** 2)
-        
-        return bool(err <= threshold)
+        return self.to_bgra(original), self.to_bgra(new)
 
 
-    def get_changed_pixels(self, path: str, project: str) -> List[Dict[str, Dict[str, int]]]:
+    @staticmethod
+    def to_bgra(image: np.ndarray) -> np.ndarray:
         """
-        Locate pixels that differ between two images.
+        Make sure an image has 4 contiguous uint8 channels.
+
+        Args:
+            image: Image as loaded by OpenCV
+
+        Returns:
+            The image in BGRA format
+        """
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+        elif image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        return np.ascontiguousarray(image, dtype=np.uint8)
+
+
+    def get_ignore_mask_path(self, project: str) -> str:
+        return f"data/{project}/ignore_mask.bin"
+
+
+    def load_ignore_mask(self, project: str, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        """
+        Load the ignore mask of a project.
+
+        The mask is stored as a packed bit array (one bit per pixel, row-major)
+        with the same size as the cropped art.
+
+        Args:
+            project: The project name
+            shape: (height, width) of the cropped art
+
+        Returns:
+            Boolean array where True means the pixel is ignored, or None if the
+            project has no (valid) mask.
+        """
+        mask_path = self.get_ignore_mask_path(project)
+        if not os.path.exists(mask_path):
+            return None
+
+        packed = np.fromfile(mask_path, dtype=np.uint8)
+        size = shape[0] * shape[1]
+        if packed.size != (size + 7) // 8:
+            print(Fore.LIGHTRED_EX + f"Warning: Ignore mask of {project} does not match the art size, ignoring it.")
+            return None
+        return np.unpackbits(packed, count=size).view(bool).reshape(shape)
+
+
+    def save_ignore_mask(self, project: str, mask: Optional[np.ndarray]) -> None:
+        """
+        Save (or remove if None) the ignore mask of a project as a packed bit array.
+
+        Args:
+            project: The project name
+            mask: Boolean array where True means the pixel is ignored
+        """
+        self.grief_states.pop(project, None)
+        mask_path = self.get_ignore_mask_path(project)
+        if mask is None or not mask.any():
+            if os.path.exists(mask_path):
+                os.remove(mask_path)
+            return
+        os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+        np.packbits(mask.astype(bool, copy=False).ravel()).tofile(mask_path)
+
+
+    def diff_images(self, original: np.ndarray, new: np.ndarray, project: str, first_only: bool = False) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Compare two BGRA images in a single integer pass.
+
+        Every pixel is compared as one uint32 word. Transparent pixels of the
+        original are normalized, skipped if the project does not check them,
+        and pixels in the project's ignore mask are never reported.
+
+        Args:
+            original: Original BGRA image
+            new: New BGRA image
+            project: The project name
+            first_only: Stop at the first changed row band and don't build the mask
+
+        Returns:
+            (changed, mask) where mask is a boolean array of changed pixels, or
+            None when first_only is set.
+        """
+        height, width = original.shape[:2]
+        original32 = original.view(np.uint32).reshape(height, width)
+        new32 = new.view(np.uint32).reshape(height, width)
+        check_transparent = self.arts_data["arts"][project]["check_transparent_pixels"]
+        ignore = self.load_ignore_mask(project, (height, width))
+
+        # Rows per band, around 64KB of pixels so early exits are cheap
+        band = height if not first_only else max(1, 16384 // max(width, 1))
+        mask = None if first_only else np.empty((height, width), dtype=bool)
+
+        for top in range(0, height, band):
+            rows = slice(top, top + band)
+            changed = self.diff_words(
+                original32[rows], new32[rows], original[rows, :, 3] == 0,
+                check_transparent, ignore[rows] if ignore is not None else None
+            )
+
+            if first_only:
+                if changed.any():
+                    return True, None
+            else:
+                mask[rows] = changed
+
+        if first_only:
+            return False, None
+        return bool(mask.any()), mask
+
+
+    @staticmethod
+    def diff_words(original32: np.ndarray, current32: np.ndarray, transparent: np.ndarray, check_transparent: bool, ignore: Optional[np.ndarray]) -> np.ndarray:
+        """
+        The change rule of diff_images, for arrays of pixels of any shape.
+
+        Args:
+            original32: Original pixels as uint32 words
+            current32: Current pixels as uint32 words
+            transparent: True where the original pixel is transparent
+            check_transparent: Whether changes over transparent pixels count
+            ignore: True for ignored pixels, or None
+
+        Returns:
+            Boolean array of changed pixels
+        """
+        changed = original32 != current32
+
+        # Normalize transparent pixel representation
+        changed &= ~(transparent & (current32 == 0))
+
+        # Dont check transparent pixels if configured
+        if not check_transparent:
+            changed &= ~transparent
+        if ignore is not None:
+            changed &= ~ignore
+        return changed
+
+
+    def get_grief_stamp(self, project: str, shape: Tuple[int, int]) -> tuple:
+        """
+        Everything the changed pixels of a project depend on besides the new
+        image. A saved grief state is only valid while this stays the same.
+        """
+        stamps = []
+        for file in (f"data/{project}/original.png", self.get_ignore_mask_path(project)):
+            try:
+                stat = os.stat(file)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return (*stamps, shape, self.arts_data["arts"][project]["check_transparent_pixels"])
+
+
+    def update_grief_state(self, project: str, new: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict]]:
+        """
+        Compare the new image with the previous snapshot of the project, and
+        only work out the pixels that differ from it.
+
+        Args:
+            project: The project name
+            new: The new BGRA image
+
+        Returns:
+            (bad, painted, newly, restored, state) where bad are the changed
+            pixels, painted the changed pixels painted since the last check,
+            newly the ones that were fine in the last check and restored the
+            ones fixed since the last check. None if there is no valid previous
+            state.
+        """
+        state = self.grief_states.get(project)
+        height, width = new.shape[:2]
+        if state is None or state["stamp"] != self.get_grief_stamp(project, (height, width)):
+            return None
+
+        new32 = new.view(np.uint32).reshape(height, width)
+        ys, xs = np.nonzero(state["snapshot"] != new32)
+        bad = state["bad"]
+        painted = np.zeros_like(bad)
+        newly = np.zeros_like(bad)
+        restored = np.zeros_like(bad)
+        if ys.size:
+            now_bad = self.diff_words(
+                state["original32"][ys, xs], new32[ys, xs], state["transparent"][ys, xs],
+                self.arts_data["arts"][project]["check_transparent_pixels"],
+                state["ignore"][ys, xs] if state["ignore"] is not None else None
+            )
+            was_bad = bad[ys, xs]
+            painted[ys[now_bad], xs[now_bad]] = True
+            newly[ys[now_bad & ~was_bad], xs[now_bad & ~was_bad]] = True
+            restored[ys[was_bad & ~now_bad], xs[was_bad & ~now_bad]] = True
+            bad[ys, xs] = now_bad
+            state["snapshot"] = new32.copy()
+        return bad, painted, newly, restored, state
+
+
+    def reset_grief_state(self, project: str, original: np.ndarray, new: np.ndarray, bad: np.ndarray) -> Dict:
+        """
+        Save the state of a project after a full comparison.
+        """
+        height, width = original.shape[:2]
+        state = {
+            "stamp": self.get_grief_stamp(project, (height, width)),
+            "original": original,
+            "original32": original.view(np.uint32).reshape(height, width),
+            "transparent": original[:, :, 3] == 0,
+            "ignore": self.load_ignore_mask(project, (height, width)),
+            "snapshot": new.view(np.uint32).reshape(height, width).copy(),
+            "bad": bad.copy(),
+            "pixels": {},
+        }
+        self.grief_states[project] = state
+        return state
+
+
+    def compare_image(self, path: str, project: str) -> bool:
+        """
+        Compares two images and returns True if no relevant pixel changed.
 
         Args:
             path: Base path for the images
             project: The project name to check
 
+        Returns:
+            bool: True if images are the same, False otherwise
+        """
+        original, new = self.load_images(path)
+        changed, _ = self.diff_images(original, new, project, first_only=True)
+        return not changed
+
+
+    def pixels_from_mask(self, mask: np.ndarray, original: np.ndarray, new: np.ndarray) -> List[Dict[str, Dict[str, int]]]:
+        """
+        Build the list of changed pixels from a change mask.
+
+        Args:
+            mask: Boolean array of changed pixels
+            original: Original BGRA image
+            new: New BGRA image
+
         Returns:
             List of dictionaries with the x, y coordinates and RGBA color of the
             changed pixels in the new image.
         """
-        # Load images with alpha channel to consider transparency differences
-        original = cv2.imread(f"{path}original.png", cv2.IMREAD_UNCHANGED)
-        new = cv2.imread(f"{path}new.png", cv2.IMREAD_UNCHANGED)
+        ys, xs = np.nonzero(mask)
+        new_colors = new[ys, xs][:, [2, 1, 0, 3]].tolist()
+        old_colors = original[ys, xs][:, [2, 1, 0, 3]]
 
-        # Check if images are loaded successfully
-        if original is None or new is None:
-            raise ValueError("Error: Could not read one or more image files.")
-        
-        # Find differing pixels
-        diff = cv2.absdiff(original, new)
-        ys, xs = np.nonzero(np.any(diff != 0, axis=2))
-
-        changed = []
-        for x, y in zip(xs, ys):
-            pixel = new[y, x]
-            b, g, r, a = pixel
-            new_color = (int(r), int(g), int(b), int(a))
-            old_color = (int(original[y, x][2]), int(original[y, x][1]), int(original[y, x][0]), int(original[y, x][3]))
-
-            # Dont check transparent pixels if configured
-            if not self.arts_data["arts"][project]["check_transparent_pixels"] and old_color[3] == 0:
-                continue
+        # Normalice transparent pixel representation
+        old_colors[old_colors[:, 3] == 0] = 0
 
-            # Normalice transparent pixel representation
-            if old_color[3] == 0:
-                old_color = (0, 0, 0, 0)
+        return [{
+            "x": x,
+            "y": y,
+            "new_color": tuple(new_color),
+            "old_color": tuple(old_color),
+        } for x, y, new_color, old_color in zip(xs.tolist(), ys.tolist(), new_colors, old_colors.tolist())]
 
-            # If both colors are the same, skip
-            if new_color == old_color:
-                continue
 
-            changed.append({
-                "x": int(x),
-                "y": int(y),
-                "new_color": new_color,
-                "old_color": old_color,
-            })
-        return changed
+    def get_changed_pixels(self, path: str, project: str) -> List[Dict[str, Dict[str, int]]]:
+        """
+        Locate pixels that differ between two images.
+
+        Args:
+            path: Base path for the images
+            project: The project name to check
+
+        Returns:
+            List of dictionaries with the x, y coordinates and RGBA color of the
+            changed pixels in the new image.
+        """
+        original, new = self.load_images(path)
+        _, mask = self.diff_images(original, new, project)
+        return self.pixels_from_mask(mask, original, new)
     
 
     @deprecated(reason="Selenium method, not used anymore")
@@ -318,9 +588,156 @@ class WPlace:
                 f.write(response.content)
 
 
+    def fetch_tile(self, url: str, rows: Optional[int] = None) -> bytes:
+        """
+        Get the raw PNG bytes of a tile from the tile source.
+
+        Args:
+            url: The URL of the tile
+            rows: If set, only the first rows are needed and sources that can
+                stream stop downloading after them
+
+        Returns:
+            The PNG file contents, maybe with only the first rows
+        """
+        # Cutting the download only pays off for arts in the top part of the tile
+        if rows is not None and rows <= PARTIAL_TILE_ROWS and hasattr(self.tile_source, "fetch_rows"):
+            return self.tile_source.fetch_rows(url, rows)
+        return self.tile_source.fetch(url)
+
+
+    def decode_art(self, tile: bytes, coords: Tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Decode a tile and crop the art out of it.
+
+        Args:
+            tile: The PNG file contents
+            coords: (start_x, start_y, end_x, end_y) coordinates of the art
+
+        Returns:
+            The cropped art as a BGRA array
+        """
+        with Image.open(BytesIO(tile)) as image:
+            cropped = np.asarray(image.crop(coords).convert("RGBA"))
+        return np.ascontiguousarray(cropped[:, :, [2, 1, 0, 3]])
+
+
+    def get_art_coords(self, project: str) -> Tuple[int, int, int, int]:
+        art = self.arts_data["arts"][project]
+        return (
+            art["start_coords"]["x"], art["start_coords"]["y"],
+            art["end_coords"]["x"], art["end_coords"]["y"]
+        )
+
+
+    def fetch_art(self, project: str) -> np.ndarray:
+        """
+        Download the tile of a project and crop its art (network and decode stages).
+
+        Args:
+            project: The project name
+
+        Returns:
+            The cropped art as a BGRA array
+        """
+        coords = self.get_art_coords(project)
+        try:
+            tile = self.fetch_tile(self.arts_data["arts"][project]["api_image"], coords[3])
+        except Exception as e:
+            raise Exception(Fore.LIGHTRED_EX + f"Error downloading image: {e}")
+        return self.decode_art(tile, coords)
+
+
+    def check_pipeline(self, projects: List[str], delay: float = 0, prefetch: int = 2) -> Iterator[Tuple[str, Optional[str], Optional[Dict], Optional[Exception]]]:
+        """
+        Check several projects, downloading and decoding the upcoming arts in a
+        background thread while the current one is being compared.
+
+        Projects on the same tile are checked together and the tile is only
+        downloaded once for all of them. The queue between both stages holds
+        at most `prefetch` decoded arts, so the downloader waits when it gets
+        too far ahead.
+
+        Args:
+            projects: The project names to check
+            delay: Seconds to wait between tile downloads to avoid rate limiting
+            prefetch: Maximum number of arts waiting to be compared
+
+        Yields:
+            (project, message, art, error) for each project, grouped by tile in
+            order of first appearance. error is set instead of message and art
+            if the check failed.
+        """
+        arts = queue.Queue(maxsize=max(prefetch, 1))
+        stop = threading.Event()
+
+        tiles: Dict[str, List[str]] = {}
+        for project in projects:
+            tiles.setdefault(self.arts_data["arts"][project]["api_image"], []).append(project)
+
+        def producer():
+            try:
+                for i, (url, group) in enumerate(tiles.items()):
+                    if stop.is_set():
+                        break
+                    # Projects can be deleted or reloaded while the cycle runs
+                    try:
+                        rows = max(self.get_art_coords(project)[3] for project in group)
+                        tile, error = self.fetch_tile(url, rows), None
+                    except Exception as e:
+                        tile, error = None, Exception(Fore.LIGHTRED_EX + f"Error downloading image: {e}")
+                    for project in group:
+                        if stop.is_set():
+                            break
+                        if error is not None:
+                            arts.put((project, None, error))
+                            continue
+                        try:
+                            arts.put((project, self.decode_art(tile, self.get_art_coords(project)), None))
+                        except Exception as e:
+                            arts.put((project, None, e))
+                    if delay and i < len(tiles) - 1:
+                        stop.wait(delay)
+            finally:
+                # The consumer waits for it whatever happens
+                arts.put(None)
+
+        thread = threading.Thread(target=self.thread_hook(producer) if self.thread_hook else producer, daemon=True)
+        thread.start()
+        with self.checked_lock:
+            self.pipelines += 1
+        try:
+            while True:
+                item = arts.get()
+                if item is None:
+                    break
+                project, image, error = item
+                if error is not None:
+                    yield project, None, None, error
+                    continue
+                try:
+                    message, art = self.check_change(project, image)
+                    yield project, message, art, None
+                except Exception as e:
+                    yield project, None, None, e
+        finally:
+            # Unblock the producer if the consumer stopped early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    arts.get_nowait()
+                except queue.Empty:
+                    thread.join(0.1)
+            with self.checked_lock:
+                self.pipelines -= 1
+            self.save_checked()
+
+
     def update_project_in_arts_file(self, art: dict, project_name: str, path: str, logs: str) -> None:
         """
         Update the project's last_checked time and griefed status in arts.json file and save logs.
+        During a check_pipeline run the arts.json update is batched with the
+        other projects, see save_checked.
 
         Args:
             art: The art dictionary to update
@@ -331,18 +748,13 @@ class WPlace:
         checked_time = time.strftime('%Y-%m-%d %H:%M:%S')
         art["last_checked"] = checked_time
 
-        try:
-            with open('data/arts.json', 'r') as file:
-                arts_data = json.load(file)
-
-            if project_name in arts_data["arts"]:
-                arts_data["arts"][project_name] = art
-                with open('data/arts.json', 'w') as file:
-                    json.dump(arts_data, file, indent=4)
-            else:
-                print(Fore.LIGHTRED_EX + f"Error: Project {project_name} not found in arts.json.")
-        except Exception as e:
-            print(Fore.LIGHTRED_EX + f"Error updating arts.json: {e}")
+        # Rewriting the whole file for every project of a cycle is too slow,
+        # pipelines batch the updates
+        with self.checked_lock:
+            self.pending_checked[project_name] = {"last_checked": art["last_checked"], "griefed": art["griefed"]}
+            batched = self.pipelines and time.time() - self.checked_saved_at < self.CHECKED_SAVE_INTERVAL
+        if not batched:
+            self.save_checked()
 
         # Save log to file
         with open(f"{path}changes.log", 'w+') as f:
@@ -350,12 +762,41 @@ class WPlace:
             f.write(logs if logs != "" else "No changes detected.\n")
 
 
-    def check_change(self, project: str) -> tuple[str, WPlaceArtInterface]:
+    def save_checked(self) -> None:
+        """
+        Write the pending last_checked and griefed fields to arts.json.
+        """
+        with self.checked_lock:
+            pending, self.pending_checked = self.pending_checked, {}
+            self.checked_saved_at = time.time()
+        if not pending:
+            return
+
+        try:
+            # Other processes (the API, other checker nodes) write it too
+            with file_lock('data/arts.json'):
+                with open('data/arts.json', 'r') as file:
+                    arts_data = json.load(file)
+
+                for project_name, fields in pending.items():
+                    if project_name in arts_data["arts"]:
+                        # Only the fields the checker owns, the rest may have
+                        # been edited through the API since this copy was loaded
+                        arts_data["arts"][project_name].update(fields)
+                    else:
+                        print(Fore.LIGHTRED_EX + f"Error: Project {project_name} not found in arts.json.")
+                write_json('data/arts.json', arts_data)
+        except Exception as e:
+            print(Fore.LIGHTRED_EX + f"Error updating arts.json: {e}")
+
+
+    def check_change(self, project: str, image: Optional[np.ndarray] = None) -> tuple[str, WPlaceArtInterface]:
         """
         Downloads the new image and checks for changes against the last image.
 
         Args:
             project: The project name to check
+            image: The already downloaded and cropped art (BGRA), if any
         """
         art = self.arts_data["arts"][project]
         api_image = art["api_image"]
@@ -365,61 +806,97 @@ class WPlace:
         )
         path = f"data/{project}/"
 
-        try:
-            print(Fore.LIGHTYELLOW_EX + f"Checking art: {Fore.RESET}{project}", end=' -> ')
-            self.download_image(api_image, f"{path}new.png")
-        except Exception as e:
-            raise Exception(Fore.LIGHTRED_EX + f"Error downloading image: {e}")
-
-        # Crop the image
-        self.crop_image(f"{path}new.png", coords)
+        print(Fore.LIGHTYELLOW_EX + f"Checking art: {Fore.RESET}{project}", end=' -> ')
+        if image is None:
+            image = self.fetch_art(project)
+        image = self.to_bgra(image)
+        previous_frame, frame = append_frame(project, image, time.time())
 
         # Check if original image exists
         if not os.path.exists(f"{path}original.png"):
-            with open(f"{path}original.png", 'wb') as f:
-                f.write(open(f"{path}new.png", 'rb').read())
+            cv2.imwrite(f"{path}original.png", image)
             print(Fore.LIGHTYELLOW_EX + "Original image not found, saving new image as original.", end=' -> ')
 
-        # Check for changes
+        # Only the pixels that differ from the last check are compared, unless
+        # there is no previous state (first check, new baseline or ignore mask)
         logs = str()
         message = ""
-        if not self.compare_image(path):
-            changed = self.get_changed_pixels(path, project)
-            if len(changed) == 0:
-                if art["griefed"]:
-                    message = "Pixels restored to original state."
-                    print(Fore.LIGHTCYAN_EX + message)
-                    art["griefed"] = False
-                else:
-                    message = "No changes detected in pixels."
-                    print(Fore.LIGHTGREEN_EX + message)
-
-                self.update_project_in_arts_file(art, project, path, logs)
-                return message, art
+        state = self.update_grief_state(project, image)
+        if state is None:
+            cv2.imwrite(f"{path}new.png", image)
+            original, new = self.load_images(path)
+            _, bad = self.diff_images(original, new, project)
+            newly, restored = bad, None
+            # Only count in the heatmap what changed since the last frame, the
+            # rest was counted before the state was lost
+            painted = bad
+            if previous_frame is not None and previous_frame.shape == frame.shape:
+                painted = bad & (previous_frame != frame)
+            state = self.reset_grief_state(project, original, new, bad)
+            state["pixels"] = {(pixel["y"], pixel["x"]): pixel for pixel in self.pixels_from_mask(bad, original, new)}
+        else:
+            bad, painted, newly, restored, state = state
+            original, new = state["original"], image
+            if painted.any() or restored.any():
+                cv2.imwrite(f"{path}new.png", image)
+            # Keep the fix plan up to date with the pixels that moved
+            for y, x in zip(*(axis.tolist() for axis in np.nonzero(restored))):
+                state["pixels"].pop((y, x), None)
+            for pixel in self.pixels_from_mask(painted, original, new):
+                state["pixels"][(pixel["y"], pixel["x"])] = pixel
+
+        total = len(state["pixels"])
+        new_count = int(np.count_nonzero(newly))
+        restored_count = int(np.count_nonzero(restored)) if restored is not None else 0
+        if painted.any():
+            update_heatmap(project, painted)
+
+        if total and (new_count or restored is None):
+            regions = summarize_regions(newly, new, coords[:2])
+            if new_count == total:
+                message = f"Detected {total} changed pixels in {len(regions)} regions!"
             else:
-                print(Fore.LIGHTRED_EX + f"Detected {len(changed)} changed pixels!")
-                message = f"Detected {len(changed)} changed pixels!"
-                logs += f"Detected {len(changed)} changed pixels!\n"
-                art["griefed"] = True
+                message = f"Detected {new_count} new changed pixels in {len(regions)} regions, {total} changed in total!"
+            print(Fore.LIGHTRED_EX + message)
+            art["griefed"] = True
 
-            for pixel in changed:
-                new_color_name, new_color_id, _ = get_color_id(pixel['new_color'])
-                old_color_name, old_color_id, _ = get_color_id(pixel['old_color'])
-                logs += f"Pixel changed at X={coords[0] + int(str(pixel['x']))}, Y={coords[1] + int(str(pixel['y']))} from {old_color_name}(id: {old_color_id}) to {new_color_name}(id: {new_color_id})\n"
+            # The full pixel list only goes to the fix command
+            logs += message + "\n" + "".join(f"Region changed at {format_region(region)}\n" for region in regions)
+            if restored_count:
+                logs += f"{restored_count} pixels restored.\n"
 
+            changed = [state["pixels"][key] for key in sorted(state["pixels"])]
             result = self.generate_command(changed, coords, path, api_image)
             command = result[0]
             skip_logs = result[1]
             same_command = result[2]
             logs += skip_logs
 
-            if art["track"] and not same_command:
-                self.send_alert(
-                    f"# ¡ALERT! {len(changed)} Pixels changed!!! :< (Before, After)\n\n## Command to fix the pixels:\n",
-                    command,
-                    f"{path}original.png",
-                    f"{path}new.png"
-                )
+            # With a live state the new pixels are known, the saved command
+            # only tells whether a rebuilt state found anything new
+            if art["track"] and new_count and (restored is not None or not same_command):
+                if total < art.get("min_changed_pixels", 1):
+                    logs += f"Below the alert threshold of {art['min_changed_pixels']} pixels, no alert sent.\n"
+                elif self.arts_data.get("alert_digest", False):
+                    self.queue_alert(project, new_count, len(regions), command, path)
+                else:
+                    summary = "".join(f"- {format_region(region)}\n" for region in regions[:5])
+                    if len(regions) > 5:
+                        summary += f"- ... and {len(regions) - 5} more regions\n"
+                    self.send_alert(
+                        f"# ¡ALERT! {new_count} Pixels changed in {project}!!! :< (Before, After)\n\n{summary}\n## Command to fix the pixels:\n",
+                        command,
+                        f"{path}original.png",
+                        f"{path}new.png"
+                    )
+        elif total:
+            # Nothing new, the known changed pixels are not processed again
+            message = f"No new changes, {total} pixels still changed."
+            if restored_count:
+                message += f" {restored_count} pixels restored."
+                self.generate_command([state["pixels"][key] for key in sorted(state["pixels"])], coords, path, api_image)
+            print(Fore.LIGHTMAGENTA_EX + message)
+            logs += message + "\n"
         else:
             if art["griefed"]:
                 message = "Pixels restored to original state."
@@ -472,9 +949,38 @@ class WPlace:
             except IOError:
                 print(Fore.LIGHTRED_EX + f"Error: Could not open {new_image} for reading.")
 
+        try:
+            self.post_webhook(discord_webhook, payload, files)
+        finally:
+            # Ensure files are closed after sending
+            for f in files.values():
+                f[1].close()
+
+            # Remove temporary command file if created
+            if os.path.exists("data/command.js"):
+                os.remove("data/command.js")
+
+
+    def post_webhook(self, discord_webhook: str, payload: dict, files: dict) -> bool:
+        """
+        Post a message to a Discord webhook, logging any error.
+
+        Args:
+            discord_webhook: The webhook URL
+            payload: Form data of the message
+            files: Attachments, as accepted by requests
+
+        Returns:
+            bool: True if the message was delivered
+        """
+        if self.alert_sink is not None:
+            self.alert_sink(payload, files)
+            return True
+
         try:
             response = requests.post(discord_webhook, data=payload, files=files)
             response.raise_for_status()
+            return True
         except requests.exceptions.HTTPError as errh:
             print(Fore.LIGHTRED_EX + f"HTTP Error: {errh}")
         except requests.exceptions.ConnectionError as errc:
@@ -483,11 +989,87 @@ class WPlace:
             print(Fore.LIGHTRED_EX + f"Timeout: {errt}")
         except requests.exceptions.RequestException as err:
             print(Fore.LIGHTRED_EX + f"Error: {err}")
-        finally:
-            # Ensure files are closed after sending
-            for f in files.values():
-                f[1].close()
+        return False
 
-            # Remove temporary command file if created
-            if os.path.exists("data/command.js"):
-                os.remove("data/command.js")
+
+    def queue_alert(self, project: str, changed: int, regions: int, command: str, path: str) -> None:
+        """
+        Queue an alert for the next digest instead of sending it right away.
+
+        A newer alert of the same project replaces the queued one.
+
+        Args:
+            project: The project name
+            changed: Number of changed pixels
+            regions: Number of changed regions
+            command: The command to fix the pixels
+            path: Base path for the images
+        """
+        comparison = None
+        try:
+            original, new = self.load_images(path)
+            gap = np.zeros((original.shape[0], 1, 4), dtype=np.uint8)
+            ok, encoded = cv2.imencode(".png", np.hstack([original, gap, new]))
+            if ok:
+                comparison = encoded.tobytes()
+        except ValueError:
+            pass
+
+        with self.alerts_lock:
+            if not self.pending_alerts:
+                self.pending_since = time.time()
+            self.pending_alerts[project] = {
+                "changed": changed,
+                "regions": regions,
+                "tile": self.get_tiles_from_api_url(self.arts_data["arts"][project]["api_image"]),
+                "command": command,
+                "comparison": comparison,
+            }
+
+
+    def flush_alerts(self, force: bool = False) -> None:
+        """
+        Send every queued alert as a single digest message.
+
+        The message contains a summary table, one (before | after) image per
+        project and a single file with all the fix commands.
+
+        Args:
+            force: Send even if the digest window has not elapsed yet
+        """
+        with self.alerts_lock:
+            if not self.pending_alerts:
+                return
+            window = self.arts_data.get("alert_digest_window", 0)
+            if not force and time.time() - self.pending_since < window:
+                return
+            alerts = self.pending_alerts
+            self.pending_alerts = {}
+
+        discord_webhook = self.arts_data["discord_webhook"]
+        if not discord_webhook:
+            print(Fore.LIGHTRED_EX + "Error: No Discord webhook URL configured.")
+            return
+
+        # Summary table, cut to fit in a single message
+        header = f"# ¡ALERT! {len(alerts)} projects changed!!! :< (Before, After)\n"
+        rows = [f"{'Project':<24} {'Pixels':>8} {'Regions':>8}  Tile"]
+        rows += [f"{name[:24]:<24} {alert['changed']:>8} {alert['regions']:>8}  {alert['tile'][0]},{alert['tile'][1]}" for name, alert in alerts.items()]
+        table = ""
+        for i, row in enumerate(rows):
+            more = f"... and {len(rows) - i} more\n"
+            if len(header) + len(table) + len(row) + len(more) + 8 > 2000:
+                table += more
+                break
+            table += row + "\n"
+        payload = {"content": header + f"```\n{table}```"}
+
+        # Discord allows 10 attachments: 9 comparisons plus the commands
+        files = {}
+        for name, alert in alerts.items():
+            if alert["comparison"] is not None and len(files) < 9:
+                files[f"file{len(files)}"] = (f"{name}.png", alert["comparison"])
+        commands = "\n\n".join(f"// {name}\n{alert['command']}" for name, alert in alerts.items())
+        files["commands"] = ("fix_commands.js", commands.encode())
+
+        self.post_webhook(discord_webhook, payload, files)
@@ -1,80 +1,322 @@
 import os
 import re
 import sys
+import gzip
 import json
+import base64
 import time
 import shutil
+import tempfile
+import hashlib
+import mimetypes
 import threading
+import cv2
+import numpy as np
 
 from flask_cors import CORS
 from pydantic import ValidationError
-from flask import Flask, Blueprint, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, send_from_directory, abort
+from werkzeug.security import safe_join
+
+# Optional, responses are only gzip compressed without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from controllers.colors import Color, color_config
-from controllers.wplace import WPlace, WPlaceArtInterface
+from controllers.coordination import Coordinator
+from controllers.command_codec import ENCODED_PATTERN, decode_pixels, encode_pixels
+from controllers.heatmap import open_heatmap, render_heatmap
+from controllers.json_files import file_lock, write_json
+from controllers.locate import locate_art
+from controllers.profiling import CheckProfiler
+from controllers.sharding import HashRing, get_shard_key
+from controllers.spatial import SpatialIndex
+from controllers.tile_sources import DirectoryTileSource, get_tile_key
+from controllers.timelapse import get_frames_path, iter_frames, stream_gif
+from controllers.wplace import WPlace, WPlaceArtInterface, IgnoreRegionInterface
 
 
 # Load arts data
 ARTS_DATA = {}
+ARTS_FILE = 'data/arts.json'
 TIME_BETWEEN_PROJECT_CHECKS = 2
 __semaforo = threading.Semaphore(1)
 
-def load_arts_data():
-    global ARTS_DATA
+# Cache state: arts.json is only re-read when its stat changes, and every
+# reload or save bumps ARTS_VERSION so cached responses get rebuilt.
+ARTS_VERSION = 0
+COLORS_VERSION = 0
+__arts_stamp = None
+__response_cache = {}
+MIN_COMPRESS_SIZE = 1024
+
+# World coordinates of every art, rebuilt when arts.json is reloaded and
+# updated on add/edit/delete
+SPATIAL_INDEX = SpatialIndex()
+
+def get_file_stamp(path: str):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        return None
+
+def load_arts_data(force: bool = False):
+    global ARTS_DATA, ARTS_VERSION, __arts_stamp
     __semaforo.acquire()
     try:
-        with open('data/arts.json', 'r') as file:
+        stamp = get_file_stamp(ARTS_FILE)
+        if not force and stamp is not None and stamp == __arts_stamp:
+            return
+        with open(ARTS_FILE, 'r') as file:
             new_data = json.load(file)
             ARTS_DATA.clear()
             ARTS_DATA.update(new_data)
+        SPATIAL_INDEX.rebuild(ARTS_DATA.get("arts", {}))
+        __arts_stamp = stamp
+        ARTS_VERSION += 1
     except Exception as e:
         print(f"Error loading arts data: {e}")
     finally:
         __semaforo.release()
 
 def save_arts_data():
-    global ARTS_DATA
+    global ARTS_DATA, ARTS_VERSION, __arts_stamp
     __semaforo.acquire()
     try:
-        with open('data/arts.json', 'w+') as file:
-            json.dump(ARTS_DATA, file, indent=4)
+        with file_lock(ARTS_FILE):
+            write_json(ARTS_FILE, ARTS_DATA)
+        __arts_stamp = get_file_stamp(ARTS_FILE)
+        ARTS_VERSION += 1
     except Exception as e:
         print(f"Error saving arts data: {e}")
     finally:
         __semaforo.release()
 
+def cached_json(key, version, build):
+    """
+    Serialize build() once per version and answer with a strong ETag, so
+    clients sending If-None-Match get a 304 without a body. Big bodies are
+    gzip (or brotli, if installed) compressed for clients that accept it,
+    and the compressed variants are cached too.
+
+    Args:
+        key: Cache key of the response
+        version: Anything that changes when the data changes
+        build: Function returning the data to serialize, or (data, headers)
+    """
+    cached = __response_cache.get(key)
+    if cached is None or cached["version"] != version:
+        result = build()
+        data, headers = result if isinstance(result, tuple) else (result, {})
+        body = app.json.dumps(data).encode()
+        cached = {"version": version, "headers": headers, "variants": {"identity": (body, hashlib.sha1(body).hexdigest())}}
+        if len(__response_cache) >= 256:
+            __response_cache.clear()
+        __response_cache[key] = cached
+
+    encoding = "identity"
+    body = cached["variants"]["identity"][0]
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = request.accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"]) or "identity"
+    if encoding not in cached["variants"]:
+        compressed = brotli.compress(body) if encoding == "br" else gzip.compress(body, 6)
+        cached["variants"][encoding] = (compressed, f"{cached['variants']['identity'][1]}-{encoding}")
+    body, etag = cached["variants"][encoding]
+
+    response = app.response_class(body, mimetype='application/json', headers=cached["headers"])
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 load_arts_data()
 WPLACE = WPlace(ARTS_DATA)
+PROFILER = CheckProfiler(WPLACE)
+
+# Only the holder of the checker lease runs the automated checks
+COORDINATOR = Coordinator()
+CHECKER_LEASE = "checker"
+LEASE_TTL = 60
+NODE_TTL = 30
+CHECKER_COMMANDS = ("check", "reload")
+
+
+def tracked_projects() -> list:
+    """
+    Names of the tracked projects, creating their folders if needed.
+    """
+    names = [name for name, art in ARTS_DATA["arts"].items() if art["track"]]
+    for name in names:
+        os.makedirs(f"data/{name}/", exist_ok=True)
+    return names
 
 
 # Flask app setup
 app = Flask(__name__,  static_folder='data/frontend_build/browser', static_url_path='')
 data_bp = Blueprint('data', __name__, static_folder='data', static_url_path='/data')
 app.register_blueprint(data_bp)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "X-Total-Count"])
+
+
+@app.teardown_request
+def discard_failed_changes(error):
+    # ARTS_DATA is only re-read when arts.json changes, so a handler that
+    # failed halfway would leave its changes in memory for the next save
+    if error is not None:
+        load_arts_data(force=True)
 
 
 # Routes
+HASHED_ASSET = re.compile(r'-[A-Z0-9]{8}\.(js|css)$')
+
+def serve_frontend(filename):
+    """
+    Serve the frontend build, using the precompressed .br/.gz variants made
+    by build_front.sh when the client accepts them. Content-hashed bundles
+    are cached forever, index.html only briefly.
+    """
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    for encoding, extension in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(path + extension):
+            response = send_from_directory(app.static_folder, filename + extension, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if HASHED_ASSET.search(filename):
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    elif filename == 'index.html':
+        response.cache_control.max_age = 60
+        response.cache_control.must_revalidate = True
+    else:
+        response.cache_control.max_age = 3600
+    return response
+
+app.view_functions['static'] = serve_frontend
+
+
 @app.get('/')
 def index():
-    return app.send_static_file('index.html')
+    return serve_frontend('index.html')
 
 
 @app.get('/projects')
 def list_projects():
+    """
+    List the projects. Optional query parameters:
+        track, griefed: "true" or "false" to filter on those fields
+        tile: "x,y" to only list the projects on that tile
+        fields: comma separated fields to return (name is always included)
+        limit, cursor: paginate, in project name order. The cursor of the
+            next page is sent in the X-Next-Cursor header.
+    """
     load_arts_data()
+    args = request.args
+    limit = args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify(message="limit must be at least 1."), 400
+    fields = [field for field in args.get('fields', '').split(',') if field]
+
+    def build():
+        names = list(ARTS_DATA["arts"])
+        for field in ("track", "griefed"):
+            if field in args:
+                wanted = args[field].lower() == "true"
+                names = [name for name in names if ARTS_DATA["arts"][name].get(field) == wanted]
+        if "tile" in args:
+            tile_x, tile_y = (int(value) for value in args["tile"].split(","))
+            on_tile = set(SPATIAL_INDEX.in_tile(tile_x, tile_y))
+            names = [name for name in names if name in on_tile]
+
+        headers = {"X-Total-Count": str(len(names))}
+        if limit is not None:
+            names.sort()
+            if "cursor" in args:
+                after = base64.urlsafe_b64decode(args["cursor"].encode()).decode()
+                names = [name for name in names if name > after]
+            if len(names) > limit:
+                headers["X-Next-Cursor"] = base64.urlsafe_b64encode(names[limit - 1].encode()).decode()
+            names = names[:limit]
+
+        projects = []
+        for name in names:
+            art = ARTS_DATA["arts"][name]
+            if fields:
+                art = {field: art[field] for field in fields if field in art}
+            projects.append({**art, "name": name})
+        return projects, headers
 
-    for project in ARTS_DATA["arts"]:
-        ARTS_DATA["arts"][project]["name"] = project
+    try:
+        return cached_json(f'projects?{request.query_string.decode()}', ARTS_VERSION, build)
+    except Exception as e:
+        return jsonify(message=str(e)), 400
+
+
+@app.get('/projects/at')
+def find_projects():
+    """
+    Find the projects covering a world pixel (x, y), or intersecting a world
+    box (box=x0,y0,x1,y1, end excluded) or a tile (tile=x,y). World
+    coordinates are the tile coordinates times 1000 plus the pixel in the tile.
+    """
+    load_arts_data()
+    args = request.args
+    try:
+        if "x" in args and "y" in args:
+            names = SPATIAL_INDEX.at(int(args["x"]), int(args["y"]))
+        elif "box" in args:
+            x0, y0, x1, y1 = (int(value) for value in args["box"].split(","))
+            if x1 <= x0 or y1 <= y0:
+                return jsonify(message="The box end must be after its start."), 400
+            names = SPATIAL_INDEX.query((x0, y0, x1, y1))
+        elif "tile" in args:
+            tile_x, tile_y = (int(value) for value in args["tile"].split(","))
+            names = SPATIAL_INDEX.in_tile(tile_x, tile_y)
+        else:
+            return jsonify(message="x and y, box or tile is required."), 400
+    except ValueError:
+        return jsonify(message="Invalid coordinates."), 400
 
-    return jsonify(list(ARTS_DATA["arts"].values()))
+    projects = []
+    for name in names:
+        x0, y0, x1, y1 = SPATIAL_INDEX.get_box(name)
+        projects.append({"name": name, "world_start": {"x": x0, "y": y0}, "world_end": {"x": x1, "y": y1}})
+    return jsonify(projects), 200
 
 
-@app.post('/projects/<name>/check')
-def check_project(name):
+@app.get('/projects/overlaps')
+def find_overlaps():
+    """
+    Every pair of projects covering some of the same pixels.
+    """
+    load_arts_data()
+    return jsonify([{"projects": [a, b]} for a, b in SPATIAL_INDEX.overlaps()]), 200
+
+
+def run_check(name: str) -> tuple:
+    """
+    Check a project in this process.
+
+    Returns:
+        (response body, status code)
+    """
     load_arts_data()
     if name not in ARTS_DATA["arts"]:
-        return jsonify(message=f"Project {name} does not exist."), 400
+        return {"message": f"Project {name} does not exist."}, 400
 
     # Create folder if it doesn't exist
     path = f"data/{name}/"
@@ -83,32 +325,115 @@ def check_project(name):
     # Check for changes
     try:
         message, response = WPLACE.check_change(name)
-        return jsonify(message=message, response=response), 200
+        WPLACE.flush_alerts()
+        return {"message": message, "response": response}, 200
     except ValueError as e:
-        return jsonify(message=str(e)), 400
+        return {"message": str(e)}, 400
 
 
-@app.post('/projects/check')
-def check_all_projects():
+def run_check_all() -> tuple:
+    """
+    Check every tracked project in this process.
+
+    Returns:
+        (response body, status code)
+    """
     load_arts_data()
     responses = []
     try:
-        for i, name in enumerate(ARTS_DATA["arts"]):
-            if not ARTS_DATA["arts"][name]["track"]:
-                continue
-
-            # Create folder if it doesn't exist
-            path = f"data/{name}/"
-            os.makedirs(path, exist_ok=True)
+        names = tracked_projects()
 
-            # Check for changes
-            _, response = WPLACE.check_change(name)
+        # Downloads are spaced to avoid rate limiting and overlap with the checks
+        for _, _, response, error in WPLACE.check_pipeline(names, TIME_BETWEEN_PROJECT_CHECKS):
+            if error is not None:
+                raise error
             responses.append(response)
+        WPLACE.flush_alerts()
+        return {"message": "All projects checked successfully.", "responses": responses}, 200
+    except Exception as e:
+        return {"message": str(e)}, 400
 
-            # Sleep for 5 seconds between checks to avoid rate limiting
-            if i < len(ARTS_DATA["arts"]) - 1:
-                time.sleep(TIME_BETWEEN_PROJECT_CHECKS)
-        return jsonify(message="All projects checked successfully.", responses=responses), 200
+
+def capture_baselines(names: list) -> tuple:
+    """
+    Check new projects to capture their baseline. Projects on the same tile
+    share one download and a failing project does not stop the others.
+
+    Returns:
+        (response body, status code)
+    """
+    load_arts_data()
+    names = [name for name in names if name in ARTS_DATA["arts"]]
+    for name in names:
+        os.makedirs(f"data/{name}/", exist_ok=True)
+
+    captured, errors = [], {}
+    for name, _, _, error in WPLACE.check_pipeline(names, TIME_BETWEEN_PROJECT_CHECKS):
+        if error is not None:
+            errors[name] = str(error)
+        else:
+            captured.append(name)
+    WPLACE.flush_alerts()
+    return {"message": f"Captured {len(captured)} of {len(names)} baselines.", "captured": captured, "errors": errors}, 200
+
+
+def run_on_checker(command: str, args: dict, timeout: float = 30):
+    """
+    Send a command to the checker if it runs in another process.
+
+    Returns:
+        The response, or None if the command must run in this process
+        (this process is the checker, or no checker is running)
+    """
+    lease = COORDINATOR.get_lease(CHECKER_LEASE)
+    if lease is None or lease["owner"] == COORDINATOR.node_id:
+        return None
+
+    command_id = COORDINATOR.submit_command(command, args)
+    result = COORDINATOR.wait_command(command_id, timeout)
+    if result is None:
+        return jsonify(message=f"Command {command_id} sent to the checker, still running.", id=command_id), 202
+    return jsonify(**result["result"]["body"]), result["result"]["status"]
+
+
+@app.post('/projects/<name>/check')
+def check_project(name):
+    delegated = run_on_checker("check", {"project": name})
+    if delegated is not None:
+        return delegated
+    body, status = run_check(name)
+    return jsonify(**body), status
+
+
+@app.post('/projects/check')
+def check_all_projects():
+    # Checking everything takes a while, give the checker more time
+    delegated = run_on_checker("check", {"project": None}, timeout=120)
+    if delegated is not None:
+        return delegated
+    body, status = run_check_all()
+    return jsonify(**body), status
+
+
+@app.post('/projects/locate')
+def locate_project():
+    """
+    Locate an art inside a tile. Expects a multipart form with the art image
+    as "template" and the tile URL as "api_image".
+    """
+    api_image = request.form.get("api_image", "")
+    if "template" not in request.files or not api_image:
+        return jsonify(message="A template image and an api_image are required."), 400
+    if not re.match(WPlaceArtInterface.model_fields["api_image"].metadata[0].pattern, api_image):
+        return jsonify(message="Validation error: api_image: Invalid tile URL"), 400
+
+    try:
+        template = cv2.imdecode(np.frombuffer(request.files["template"].read(), np.uint8), cv2.IMREAD_UNCHANGED)
+        if template is None:
+            return jsonify(message="Error: Could not read the template image."), 400
+        tile = cv2.imdecode(np.frombuffer(WPLACE.fetch_tile(api_image), np.uint8), cv2.IMREAD_UNCHANGED)
+        result = locate_art(WPLACE.to_bgra(tile), WPLACE.to_bgra(template))
+        return jsonify(message="Art located successfully.", response=result), 200
     except Exception as e:
         return jsonify(message=str(e)), 400
 
@@ -120,19 +445,48 @@ def edit_project(project):
         return jsonify(message=f"Project {project} does not exist."), 404
     try:
         data = request.json
-        if not data:
+        if not data or not isinstance(data, dict):
             return jsonify(message="No data provided."), 400
-        for key in data:
-            if key in ARTS_DATA["arts"][project] and key != "name":
-                ARTS_DATA["arts"][project][key] = data[key]
+        # The edited project must still be valid as a whole
+        edited = {**ARTS_DATA["arts"][project], **{key: value for key, value in data.items() if key in WPlaceArtInterface.model_fields}}
+        validated_project = WPlaceArtInterface(**{**edited, "name": project})
+        ARTS_DATA["arts"][project].update(project_from_model(validated_project))
+        SPATIAL_INDEX.add(project, ARTS_DATA["arts"][project])
 
         # Save changes to file
         save_arts_data()
+    except ValidationError as e:
+        return jsonify(message="Validation error: " + "; ".join(format_validation_error(e))), 400
     except Exception as e:
         return jsonify(message=str(e)), 400
     return jsonify(message=f"Project {project} edited successfully."), 200
 
 
+def project_from_model(validated_project: WPlaceArtInterface) -> dict:
+    """
+    The arts.json entry of a validated project.
+    """
+    return {
+        "track": validated_project.track,
+        "check_transparent_pixels": validated_project.check_transparent_pixels,
+        "last_checked": validated_project.last_checked,
+        "griefed": validated_project.griefed,
+        "api_image": validated_project.api_image,
+        "start_coords": {"x": validated_project.start_coords.x, "y": validated_project.start_coords.y},
+        "end_coords": {"x": validated_project.end_coords.x, "y": validated_project.end_coords.y},
+        "min_changed_pixels": validated_project.min_changed_pixels
+    }
+
+
+def format_validation_error(e: ValidationError) -> list:
+    errors = []
+    for error in e.errors():
+        field = ".".join(str(loc) for loc in error['loc'])
+        msg = error['msg']
+        errors.append(f"{field}: {msg}")
+    return errors
+
+
 @app.post('/projects')
 def add_project():
     load_arts_data()
@@ -151,33 +505,23 @@ def add_project():
         validated_project = WPlaceArtInterface(**data)
         
         # Add project
-        ARTS_DATA["arts"][name] = {
-            "track": validated_project.track,
-            "check_transparent_pixels": validated_project.check_transparent_pixels,
-            "last_checked": validated_project.last_checked,
-            "griefed": validated_project.griefed,
-            "api_image": validated_project.api_image,
-            "start_coords": {"x": validated_project.start_coords.x, "y": validated_project.start_coords.y},
-            "end_coords": {"x": validated_project.end_coords.x, "y": validated_project.end_coords.y}
-        }
+        ARTS_DATA["arts"][name] = project_from_model(validated_project)
+        SPATIAL_INDEX.add(name, ARTS_DATA["arts"][name])
 
         # Save changes to file
         save_arts_data()
 
-        # Check for changes after adding
+        # Capture the baseline, on the checker if it runs in another process
         if validated_project.track:
-            path = f"data/{name}/"
-            os.makedirs(path, exist_ok=True)
-            _, response = WPLACE.check_change(name)
-            return jsonify(message=f"Project {name} added and checked successfully.", response=response), 200
+            delegated = run_on_checker("check", {"project": name})
+            if delegated is not None:
+                return delegated
+            body, status = run_check(name)
+            if status != 200:
+                return jsonify(**body), status
+            return jsonify(message=f"Project {name} added and checked successfully.", response=body["response"]), 200
     except ValidationError as e:
-        errors = []
-        for error in e.errors():
-            field = ".".join(str(loc) for loc in error['loc'])
-            msg = error['msg']
-            errors.append(f"{field}: {msg}")
-        
-        return jsonify(message="Validation error: " + "; ".join(errors)), 400
+        return jsonify(message="Validation error: " + "; ".join(format_validation_error(e))), 400
     
     except Exception as e:
         return jsonify(message=str(e)), 400
@@ -185,6 +529,72 @@ def add_project():
     return jsonify(message=f"Project {name} added successfully."), 200
 
 
+@app.post('/projects/bulk')
+def add_projects():
+    """
+    Add many projects at once, as a list or as {"projects": [...]}.
+
+    Every project is validated first and nothing is added if any of them is
+    invalid; the errors of all of them are returned together. The baselines
+    of the tracked projects are captured by the checker afterwards, one
+    download per tile.
+    """
+    load_arts_data()
+    data = request.json
+    if isinstance(data, dict):
+        data = data.get("projects")
+    if not data or not isinstance(data, list):
+        return jsonify(message="No projects provided."), 400
+
+    projects = {}
+    errors = []
+    seen = set()
+    for i, item in enumerate(data):
+        if not isinstance(item, dict):
+            errors.append({"index": i, "name": None, "errors": ["Project must be an object."]})
+            continue
+        name = item.get("name")
+        item_errors = []
+        if not name:
+            item_errors.append("Project name is required.")
+        elif not isinstance(name, str):
+            item_errors.append("Project name must be a string.")
+        elif name in ARTS_DATA["arts"]:
+            item_errors.append(f"Project {name} already exists.")
+        elif name in seen:
+            item_errors.append(f"Project {name} is duplicated.")
+        else:
+            seen.add(name)
+        try:
+            validated_project = WPlaceArtInterface(**item)
+            if not item_errors:
+                projects[name] = project_from_model(validated_project)
+        except ValidationError as e:
+            item_errors += format_validation_error(e)
+        if item_errors:
+            errors.append({"index": i, "name": name, "errors": item_errors})
+
+    if errors:
+        return jsonify(message=f"Validation error in {len(errors)} of {len(data)} projects, nothing was added.", errors=errors), 400
+
+    # One write for the whole batch
+    ARTS_DATA["arts"].update(projects)
+    for name, art in projects.items():
+        SPATIAL_INDEX.add(name, art)
+    save_arts_data()
+
+    tracked = [name for name, art in projects.items() if art["track"]]
+    if not tracked:
+        return jsonify(message=f"{len(projects)} projects added."), 200
+
+    command_id = COORDINATOR.submit_command("baseline", {"projects": tracked})
+    tiles = len({projects[name]["api_image"] for name in tracked})
+    message = f"{len(projects)} projects added, capturing {len(tracked)} baselines from {tiles} tiles."
+    if COORDINATOR.get_lease(CHECKER_LEASE) is None:
+        message += " No checker is running, they will be captured when one starts."
+    return jsonify(message=message, id=command_id), 202
+
+
 @app.delete('/projects/<project>')
 def delete_project(project):
     load_arts_data()
@@ -192,6 +602,8 @@ def delete_project(project):
         return jsonify(message=f"Project {project} does not exist."), 404
     try:
         del ARTS_DATA["arts"][project]
+        SPATIAL_INDEX.remove(project)
+        WPLACE.grief_states.pop(project, None)
 
         # Save changes to file
         save_arts_data()
@@ -204,9 +616,121 @@ def delete_project(project):
     return jsonify(message=f"Project {project} deleted successfully."), 200
 
 
+@app.get('/projects/<project>/ignore-mask')
+def get_project_ignore_mask(project):
+    load_arts_data()
+    if project not in ARTS_DATA["arts"]:
+        return jsonify(message=f"Project {project} does not exist."), 404
+    art = ARTS_DATA["arts"][project]
+    shape = (art["end_coords"]["y"] - art["start_coords"]["y"], art["end_coords"]["x"] - art["start_coords"]["x"])
+    mask = WPLACE.load_ignore_mask(project, shape)
+    return jsonify(ignored_pixels=int(mask.sum()) if mask is not None else 0), 200
+
+
+@app.put('/projects/<project>/ignore-mask')
+def set_project_ignore_mask(project):
+    """
+    Replace the ignore mask of a project with a list of regions in tile
+    coordinates, using the same convention as start_coords/end_coords.
+    """
+    load_arts_data()
+    if project not in ARTS_DATA["arts"]:
+        return jsonify(message=f"Project {project} does not exist."), 404
+    data = request.json
+    if not data or "regions" not in data:
+        return jsonify(message="No data provided."), 400
+
+    art = ARTS_DATA["arts"][project]
+    start_x, start_y = art["start_coords"]["x"], art["start_coords"]["y"]
+    mask = np.zeros((art["end_coords"]["y"] - start_y, art["end_coords"]["x"] - start_x), dtype=bool)
+    try:
+        for region in data["regions"]:
+            region = IgnoreRegionInterface(**region)
+            mask[
+                max(region.start_coords.y - start_y, 0):max(region.end_coords.y - start_y, 0),
+                max(region.start_coords.x - start_x, 0):max(region.end_coords.x - start_x, 0)
+            ] = True
+        WPLACE.save_ignore_mask(project, mask)
+    except ValidationError as e:
+        errors = [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+        return jsonify(message="Validation error: " + "; ".join(errors)), 400
+    except Exception as e:
+        return jsonify(message=str(e)), 400
+    return jsonify(message=f"Ignore mask of {project} updated ({int(mask.sum())} pixels ignored)."), 200
+
+
+@app.delete('/projects/<project>/ignore-mask')
+def delete_project_ignore_mask(project):
+    load_arts_data()
+    if project not in ARTS_DATA["arts"]:
+        return jsonify(message=f"Project {project} does not exist."), 404
+    WPLACE.save_ignore_mask(project, None)
+    return jsonify(message=f"Ignore mask of {project} removed."), 200
+
+
+@app.get('/projects/<project>/heatmap')
+def get_project_heatmap(project):
+    """
+    Grief heatmap of a project: a colour-mapped PNG (format=png, default),
+    the raw little-endian uint32 counters (format=raw) or the changed pixels
+    with their counts in tile coordinates (format=json).
+    """
+    load_arts_data()
+    if project not in ARTS_DATA["arts"]:
+        return jsonify(message=f"Project {project} does not exist."), 404
+    art = ARTS_DATA["arts"][project]
+    start_x, start_y = art["start_coords"]["x"], art["start_coords"]["y"]
+    shape = (art["end_coords"]["y"] - start_y, art["end_coords"]["x"] - start_x)
+    counts = open_heatmap(project, shape)
+    if counts is None:
+        return jsonify(message=f"No heatmap found for project {project}."), 404
+
+    output = request.args.get('format', 'png')
+    try:
+        if output == 'raw':
+            response = app.response_class(counts.tobytes(), mimetype='application/octet-stream')
+            response.headers['X-Heatmap-Width'] = str(shape[1])
+            response.headers['X-Heatmap-Height'] = str(shape[0])
+            return response
+        if output == 'json':
+            ys, xs = np.nonzero(counts)
+            return jsonify(
+                width=shape[1],
+                height=shape[0],
+                max=int(counts.max()),
+                pixels=[[x + start_x, y + start_y, int(count)] for x, y, count in zip(xs.tolist(), ys.tolist(), counts[ys, xs].tolist())]
+            ), 200
+        scale = min(max(request.args.get('scale', 1, type=int), 1), 16)
+        return app.response_class(render_heatmap(counts, scale), mimetype='image/png')
+    except Exception as e:
+        return jsonify(message=str(e)), 400
+
+
+@app.get('/projects/<project>/timelapse')
+def get_project_timelapse(project):
+    """
+    Stream the recorded history of a project as an animated GIF.
+    """
+    load_arts_data()
+    if project not in ARTS_DATA["arts"]:
+        return jsonify(message=f"Project {project} does not exist."), 404
+    if not os.path.exists(get_frames_path(project)):
+        return jsonify(message=f"No frames recorded for project {project}."), 404
+
+    fps = min(max(request.args.get('fps', 10, type=float), 0.1), 50)
+    scale = min(max(request.args.get('scale', 1, type=int), 1), 16)
+    step = max(request.args.get('step', 1, type=int), 1)
+
+    return Response(
+        stream_gif(iter_frames(project), fps, scale, step),
+        mimetype='image/gif',
+        headers={"Content-Disposition": f'inline; filename="{project}.gif"'}
+    )
+
+
 @app.get('/config/colors')
 def get_colors():
-    return jsonify([{
+    return cached_json('colors', COLORS_VERSION, lambda: [{
         "name": color.name,
         "rgb": color_config.get_rgb(color.name),
         "enabled": color_config.get_bool(color.name)
@@ -215,6 +739,7 @@ def get_colors():
 
 @app.put('/config/colors')
 def update_colors():
+    global COLORS_VERSION
     data = request.json
     if not data:
         return jsonify(message="No data provided."), 400
@@ -222,17 +747,20 @@ def update_colors():
     for color_name, enabled in data["colors"].items():
         color_config.set_bool(color_name, enabled)
     color_config.save_config()
+    COLORS_VERSION += 1
     return jsonify(message="Colors updated successfully."), 200
 
 
 @app.get('/projects/automation')
 def get_automation_info():
     load_arts_data()
-    return jsonify({
+    return cached_json('automation', ARTS_VERSION, lambda: {
         "discord_webhook": ARTS_DATA["discord_webhook"],
         "cooldown_between_checks": ARTS_DATA["cooldown_between_checks"],
-        "automated_checks": ARTS_DATA["automated_checks"]
-    }), 200
+        "automated_checks": ARTS_DATA["automated_checks"],
+        "alert_digest": ARTS_DATA.get("alert_digest", False),
+        "alert_digest_window": ARTS_DATA.get("alert_digest_window", 0)
+    })
 
 
 @app.put('/projects/automation')
@@ -242,8 +770,17 @@ def update_automation_info():
     if not data:
         return jsonify(message="No data provided."), 400
 
-    ARTS_DATA["discord_webhook"] = data.get("discord_webhook", ARTS_DATA["discord_webhook"])
-    ARTS_DATA["cooldown_between_checks"] = int(data.get("cooldown_between_checks", ARTS_DATA["cooldown_between_checks"]))
+    # Everything is converted first, so an invalid value changes nothing
+    try:
+        updates = {
+            "discord_webhook": data.get("discord_webhook", ARTS_DATA["discord_webhook"]),
+            "cooldown_between_checks": int(data.get("cooldown_between_checks", ARTS_DATA["cooldown_between_checks"])),
+            "alert_digest": bool(data.get("alert_digest", ARTS_DATA.get("alert_digest", False))),
+            "alert_digest_window": int(data.get("alert_digest_window", ARTS_DATA.get("alert_digest_window", 0))),
+        }
+    except (TypeError, ValueError) as e:
+        return jsonify(message=f"Invalid value: {e}"), 400
+    ARTS_DATA.update(updates)
 
     save_arts_data()
     return jsonify(message="Information updated successfully."), 200
@@ -269,10 +806,13 @@ def get_project_logs(project):
     log_path = f"data/{project}/changes.log"
     if not os.path.exists(log_path):
         return jsonify(message=f"No logs found for project {project}."), 404
-    try:
+    def build():
         with open(log_path, 'r') as file:
             logs = file.readlines()[:10000]
-        return jsonify(message=''.join(logs)), 200
+        return {"message": ''.join(logs)}
+
+    try:
+        return cached_json(f'logs/{project}', get_file_stamp(log_path), build)
     except Exception as e:
         return jsonify(message=str(e)), 400
     
@@ -288,14 +828,19 @@ def get_project_fix_command(project):
 
     limit = request.args.get('limit', type=int)
 
-    try:
+    def build():
         with open(log_path, 'r') as file:
             fix_command = file.read()
 
         if limit is not None and limit > 0:
             # Find pixelData array and limit its elements
             match = re.search(r'const pixelData = \[', fix_command)
-            if match:
+            encoded = ENCODED_PATTERN.search(fix_command)
+            if encoded:
+                palette = {int(k): v for k, v in json.loads(encoded.group(2)).items()}
+                limited, palette = encode_pixels(decode_pixels(encoded.group(1), palette)[:limit])
+                fix_command = fix_command[:encoded.start()] + f'decodePixels("{limited}", {json.dumps(palette, separators=(",", ":"))})' + fix_command[encoded.end():]
+            elif match:
                 start_idx = match.end()
                 # Parse the array manually to handle nested arrays
                 bracket_count = 1
@@ -321,44 +866,261 @@ def get_project_fix_command(project):
                 suffix = fix_command[idx-1:]
                 fix_command = prefix + ', '.join(limited_elements) + suffix
 
-        return jsonify(message=fix_command), 200
+        return {"message": fix_command}
+
+    try:
+        return cached_json(f'fix-command/{project}/{limit}', get_file_stamp(log_path), build)
     except Exception as e:
         return jsonify(message=str(e)), 400
 
 
-def automated_check_loop():
+def run_profile(action: str, data: dict) -> tuple:
+    """
+    Arm ("arm"), stop ("stop") or query ("status") the profiler of this
+    process.
+
+    Returns:
+        (response body, status code)
+    """
+    if action == "status":
+        return PROFILER.status(), 200
+    if action == "stop":
+        if PROFILER.disarm() is None:
+            return {"message": "The profiler is not armed."}, 400
+        return {"message": "Profiler stopped.", "response": PROFILER.status()}, 200
+
+    try:
+        PROFILER.arm(
+            int(data.get("calls", 1)),
+            data.get("mode", "deterministic"),
+            data.get("scope", "check"),
+            bool(data.get("tracemalloc", False)),
+            float(data.get("interval", 0.005))
+        )
+    except Exception as e:
+        return {"message": str(e)}, 400
+    return {"message": "Profiler armed.", "response": PROFILER.status()}, 200
+
+
+def profile_on_checker(action: str, data: dict):
+    # The checks run in the checker, so that is the process to profile
+    delegated = run_on_checker("profile", {"action": action, "options": data})
+    if delegated is not None:
+        return delegated
+    body, status = run_profile(action, data)
+    return jsonify(**body), status
+
+
+@app.get('/admin/profile')
+def get_profile_status():
+    return profile_on_checker("status", {})
+
+
+@app.post('/admin/profile')
+def start_profile():
+    """
+    Profile the next "calls" check_change calls (scope "check") or check
+    cycles (scope "cycle"), in "deterministic" or "sampling" mode, optionally
+    with a tracemalloc snapshot. The checker is profiled, even when it runs
+    in another process.
+    """
+    return profile_on_checker("arm", request.json or {})
+
+
+@app.delete('/admin/profile')
+def stop_profile():
+    return profile_on_checker("stop", {})
+
+
+@app.get('/admin/profile/<filename>')
+def download_profile(filename):
+    # Written by whichever process was profiled, into the shared data folder
+    path = safe_join(os.path.abspath(PROFILER.output_dir), filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify(message=f"Profile {filename} does not exist."), 404
+    return send_from_directory(os.path.abspath(PROFILER.output_dir), filename, as_attachment=True)
+
+
+AUTOMATION_STATUS = {
+    "cycles": 0,
+    "last_cycle_started": None,
+    "last_cycle_seconds": None,
+    "last_cycle_projects": 0,
+    "last_cycle_errors": 0
+}
+
+@app.get('/checker/status')
+def get_checker_status():
+    lease = COORDINATOR.get_lease(CHECKER_LEASE)
+    return jsonify(
+        leader=lease["owner"] if lease else None,
+        lease_expires_at=lease["expires_at"] if lease else None,
+        node=COORDINATOR.node_id,
+        status=COORDINATOR.get_status(CHECKER_LEASE),
+        nodes=COORDINATOR.live_nodes(NODE_TTL)
+    ), 200
+
+
+@app.post('/checker/commands')
+def submit_checker_command():
+    """
+    Queue a command for the checker: "check" (a project, or every project if
+    no project is given) or "reload" (read arts.json again).
+    """
+    data = request.json or {}
+    command = data.get("command")
+    if command not in CHECKER_COMMANDS:
+        return jsonify(message=f"Unknown command {command}. Valid commands: {', '.join(CHECKER_COMMANDS)}."), 400
+
+    command_id = COORDINATOR.submit_command(command, {"project": data.get("project")})
+    message = f"Command {command_id} queued."
+    if COORDINATOR.get_lease(CHECKER_LEASE) is None:
+        message += " No checker is running, it will run when one starts."
+    return jsonify(message=message, id=command_id), 202
+
+
+@app.get('/checker/commands/<int:command_id>')
+def get_checker_command(command_id):
+    command = COORDINATOR.get_command(command_id)
+    if command is None:
+        return jsonify(message=f"Command {command_id} does not exist."), 404
+    return jsonify(command), 200
+
+
+def handle_command(command: dict) -> None:
+    """
+    Run a command sent to the checker and store its result.
+    """
+    print(f"[AUTOMATION] Running command {command['id']}: {command['command']} {command['args']}")
+    try:
+        if command["command"] == "check":
+            project = command["args"].get("project")
+            body, status = run_check(project) if project else run_check_all()
+        elif command["command"] == "baseline":
+            body, status = capture_baselines(command["args"].get("projects", []))
+        elif command["command"] == "profile":
+            body, status = run_profile(command["args"]["action"], command["args"].get("options", {}))
+        elif command["command"] == "reload":
+            load_arts_data(force=True)
+            body, status = {"message": "Configuration reloaded."}, 200
+        else:
+            body, status = {"message": f"Unknown command {command['command']}."}, 400
+        COORDINATOR.finish_command(command["id"], {"body": body, "status": status})
+    except Exception as e:
+        COORDINATOR.finish_command(command["id"], {"body": {"message": str(e)}, "status": 500}, "error")
+
+
+def keep_alive(sharded: bool) -> bool:
+    """
+    Renew the checker lease and, for sharded checkers, the node heartbeat.
+
+    Returns:
+        bool: True if this process holds the checker lease
+    """
+    leader = COORDINATOR.acquire_lease(CHECKER_LEASE, LEASE_TTL)
+    if sharded:
+        COORDINATOR.heartbeat({**AUTOMATION_STATUS, "leader": leader})
+    return leader
+
+
+def serve_commands_for(seconds: float, sharded: bool = False) -> bool:
+    """
+    Wait between cycles while keeping the lease, running the queued commands
+    and publishing the status.
+
+    Returns:
+        bool: False if the lease was lost
+    """
+    deadline = time.time() + seconds
+    while True:
+        leader = keep_alive(sharded)
+        if not leader and not sharded:
+            return False
+        if leader:
+            for command in COORDINATOR.claim_commands():
+                handle_command(command)
+            COORDINATOR.set_status(CHECKER_LEASE, {**AUTOMATION_STATUS, "node": COORDINATOR.node_id})
+        # Digests are due even when the automated checks are off
+        WPLACE.flush_alerts()
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return leader
+        time.sleep(min(1, remaining))
+
+
+def shard_projects(names: list) -> list:
+    """
+    The projects this node checks: projects are spread over the live nodes
+    by consistent hashing of their tile, so a node joining or dying only
+    moves the tiles next to it on the ring.
+    """
+    nodes = [node["node"] for node in COORDINATOR.live_nodes(NODE_TTL)]
+    ring = HashRing(nodes + [COORDINATOR.node_id])
+    return [
+        name for name in names
+        if ring.owner(get_shard_key(ARTS_DATA["arts"][name]["api_image"])) == COORDINATOR.node_id
+    ]
+
+
+def automated_check_loop(sharded: bool = False):
     """
     Loop to perform automated checks based on configuration.
+
+    Only the process holding the checker lease checks, the others wait for
+    the lease to expire. With sharded=True every node checks its share of
+    the projects and the lease holder also runs the queued commands.
     """
     global ARTS_DATA
-    
+
+    leader = False
+    shard = None
     while True:
+        is_leader = keep_alive(sharded)
+        if is_leader != leader:
+            print(f"[AUTOMATION] {'Acquired' if is_leader else 'Lost'} the checker lease as {COORDINATOR.node_id}")
+            leader = is_leader
+        if not leader and not sharded:
+            time.sleep(LEASE_TTL / 4)
+            continue
+
         load_arts_data()
         if ARTS_DATA.get("automated_checks", False):
             cooldown = ARTS_DATA.get("cooldown_between_checks", 300)
-            
+
             try:
                 print(f"[AUTOMATION] Starting automated check at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                for i, name in enumerate(ARTS_DATA["arts"]):
-                    if not ARTS_DATA["arts"][name]["track"]:
-                        continue
-                    
-                    path = f"data/{name}/"
-                    os.makedirs(path, exist_ok=True)
-                    
-                    WPLACE.check_change(name)
-                    
-                    if i < len(ARTS_DATA["arts"]) - 1:
-                        time.sleep(TIME_BETWEEN_PROJECT_CHECKS)
-
-                print(f"[AUTOMATION] Completed automated check. Checked {len(ARTS_DATA['arts'])} projects.")
+                started = time.time()
+                errors = 0
+                names = tracked_projects()
+                if sharded:
+                    names = shard_projects(names)
+                    if shard != set(names):
+                        print(f"[AUTOMATION] This node now checks {len(names)} projects")
+                        shard = set(names)
+                for name, _, _, error in WPLACE.check_pipeline(names, TIME_BETWEEN_PROJECT_CHECKS):
+                    # Long cycles must not let the lease or the heartbeat expire
+                    keep_alive(sharded)
+                    if error is not None:
+                        errors += 1
+                        print(f"[AUTOMATION] Error checking {name}: {error}")
+
+                WPLACE.flush_alerts()
+                AUTOMATION_STATUS.update(
+                    cycles=AUTOMATION_STATUS["cycles"] + 1,
+                    last_cycle_started=started,
+                    last_cycle_seconds=time.time() - started,
+                    last_cycle_projects=len(names),
+                    last_cycle_errors=errors
+                )
+                print(f"[AUTOMATION] Completed automated check. Checked {len(names)} projects.")
             except Exception as e:
                 print(f"[AUTOMATION] Error during automated check: {e}")
             finally:
                 print(f"[AUTOMATION] Next check in {cooldown} seconds")
-                time.sleep(cooldown)
+                serve_commands_for(cooldown, sharded)
         else:
-            time.sleep(10)  # Sleep for a while before checking again
+            serve_commands_for(10, sharded)  # Wait for a while before checking again
 
 
 def sanitize():
@@ -379,6 +1141,68 @@ def sanitize():
         save_arts_data()
 
 
+def replay(recording: str):
+    """
+    Run every configured project against a recording of tiles, as fast as
+    possible: no network, no sleeps and alerts go to a counter.
+
+    The recording is a directory laid out as <tile_x>/<tile_y>/<unix timestamp>.png.
+    The checks run in a temporary copy of the data folder (configuration,
+    original images and ignore masks), so the real projects are not touched.
+    """
+    source = DirectoryTileSource(os.path.abspath(recording))
+    timestamps = source.timestamps()
+    if not timestamps:
+        print(f"[REPLAY] No recorded tiles found in {recording}")
+        return
+
+    # Scratch copy of the data folder
+    workdir = tempfile.mkdtemp(prefix="wplace-replay-")
+    for project in ARTS_DATA["arts"]:
+        os.makedirs(f"{workdir}/data/{project}", exist_ok=True)
+        for file in ("original.png", "ignore_mask.bin"):
+            if os.path.exists(f"data/{project}/{file}"):
+                shutil.copy(f"data/{project}/{file}", f"{workdir}/data/{project}/{file}")
+    with open(f"{workdir}/data/arts.json", "w") as file:
+        json.dump({**ARTS_DATA, "discord_webhook": "replay://sink", "alert_digest": False}, file)
+    os.chdir(workdir)
+    load_arts_data(force=True)
+
+    alerts = []
+    events = {project: [] for project in ARTS_DATA["arts"]}
+    WPLACE.tile_source = source
+    WPLACE.alert_sink = lambda payload, files: alerts.append(payload.get("content", ""))
+
+    by_tile = {}
+    for project, art in ARTS_DATA["arts"].items():
+        by_tile.setdefault(get_tile_key(art["api_image"]), []).append(project)
+
+    checks = 0
+    tiles = 0
+    started = time.time()
+    for timestamp in timestamps:
+        source.seek(timestamp)
+        recorded = source.tiles_at(timestamp)
+        names = [name for tile in recorded for name in by_tile.get(tile, [])]
+        tiles += len(recorded)
+        for name, message, _, error in WPLACE.check_pipeline(names):
+            checks += 1
+            if error is not None:
+                events[name].append((timestamp, f"Error: {error}"))
+            elif not message.startswith("No changes"):
+                events[name].append((timestamp, message))
+    elapsed = time.time() - started
+
+    print("[REPLAY] Detection events")
+    for project, project_events in events.items():
+        print(f"  {project}: {len(project_events)} events")
+        for timestamp, message in project_events:
+            print(f"    [{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}] {message}")
+    print(f"[REPLAY] {len(timestamps)} timestamps, {tiles} tiles, {checks} checks, {len(alerts)} alerts in {elapsed:.2f}s")
+    print(f"[REPLAY] Throughput: {tiles / elapsed if elapsed else 0:.1f} tiles/s, {checks / elapsed if elapsed else 0:.1f} checks/s")
+    print(f"[REPLAY] Scratch data left in {workdir}")
+
+
 def main(args: list):
     # sanitize()
     if len(args) == 3 and args[1] == "--check":
@@ -386,6 +1210,24 @@ def main(args: list):
             return check_all_projects()
         else:
             return check_project(args[2])
+    if len(args) == 3 and args[1] == "--replay":
+        return replay(args[2])
+    if len(args) in (2, 3) and args[1] == "--worker" and args[2:] in ([], ["--sharded"]):
+        sharded = len(args) == 3
+        print(f"Starting {'sharded ' if sharded else ''}checker worker {COORDINATOR.node_id}...")
+        try:
+            automated_check_loop(sharded)
+        except KeyboardInterrupt:
+            print("Detected Ctrl + C")
+        finally:
+            COORDINATOR.release_lease(CHECKER_LEASE)
+            if sharded:
+                COORDINATOR.leave()
+        return
+    if len(args) == 2 and args[1] == "--api-only":
+        print("Starting server without checker...")
+        app.run(host='0.0.0.0', port=5000)
+        return
     if len(args) == 1:
         print("Starting server...")
         try:
@@ -395,11 +1237,18 @@ def main(args: list):
             print("Detected Ctrl + C")
         except Exception as e:
             print(f"Error: {e}")
+        finally:
+            # Let the next checker take over right away
+            COORDINATOR.release_lease(CHECKER_LEASE)
     else:
         print("Usage:")
         print("  python main.py                         # Start the server")
+        print("  python main.py --worker                # Run only the checker")
+        print("  python main.py --worker --sharded      # Run a checker sharing the projects with the other nodes")
+        print("  python main.py --api-only              # Start the server without the checker")
         print("  python main.py --check all             # Check all projects for changes")
         print("  python main.py --check <project_name>  # Check a specific project for changes")
+        print("  python main.py --replay <directory>     # Run the checks over recorded tiles")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""
+Validates and benchmarks the row-limited tile downloads against downloading
+and decoding the whole tile.
+
+Serves synthetic tiles from a local keep-alive HTTP or HTTPS server (mostly
+transparent, with arts drawn on them, as palette and RGBA PNGs), then for
+arts ending at different rows of the tile compares the cropped art of both
+paths, times them and counts the connections they open.
+
+Usage:
+    python scripts/bench_stream_decode.py --runs 20 --tls --latency 0.002
+    python scripts/bench_stream_decode.py --tls --drain-limit 0   # Always drop the rest of the body
+"""
+import io
+import os
+import sys
+import ssl
+import socket
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import threading
+import numpy as np
+import requests
+
+from PIL import Image
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from controllers.colors import PALETTE
+from controllers.tile_sources import HttpTileSource
+from controllers.wplace import WPlace
+
+
+# (name, (start_x, start_y, end_x, end_y))
+LAYOUTS = [
+    ("top", (100, 20, 180, 100)),
+    ("upper third", (400, 250, 500, 330)),
+    ("middle", (450, 460, 550, 540)),
+    ("bottom", (800, 900, 900, 1000)),
+    ("full tile", (0, 0, 1000, 1000)),
+]
+
+
+def build_tile(seed: int) -> np.ndarray:
+    """
+    A tile like the real ones: transparent with some flat arts, noisy
+    scribbles and a few lines of text-like detail.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.zeros((1000, 1000), dtype=np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, 950, 2)
+        w, h = rng.integers(10, 120, 2)
+        ids[y:y + h, x:x + w] = rng.integers(1, 32)
+    for _ in range(15):
+        x, y = rng.integers(0, 960, 2)
+        ids[y:y + 40, x:x + 40] = rng.integers(1, 32, (len(ids[y:y + 40]), len(ids[0, x:x + 40])))
+    return ids
+
+
+def encode(ids: np.ndarray, mode: str) -> bytes:
+    out = io.BytesIO()
+    if mode == "palette":
+        image = Image.fromarray(ids).convert("P")
+        image.putpalette(PALETTE[:, :3].flatten().tolist())
+        image.save(out, "PNG", transparency=0)
+    else:
+        Image.fromarray(PALETTE[ids]).save(out, "PNG")
+    return out.getvalue()
+
+
+class TileServer:
+    def __init__(self, tiles: dict, latency: float = 0.0, tls: bool = False):
+        self.sent = 0
+        self.connections = 0
+        self.latency = latency
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real backend
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                server.connections += 1
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = tiles[self.path]
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    # In pieces, so a client that stops reading is noticed
+                    for i in range(0, len(body), 16384):
+                        self.wfile.write(body[i:i + 16384])
+                        server.sent += len(body[i:i + 16384])
+                        if server.latency:
+                            time.sleep(server.latency)
+                except OSError:
+                    # The client dropped the rest of the body
+                    self.close_connection = True
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        if tls:
+            # Self-signed certificate, the client does not verify it
+            folder = tempfile.mkdtemp()
+            subprocess.run([
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                "-keyout", f"{folder}/key.pem", "-out", f"{folder}/cert.pem"
+            ], check=True, capture_output=True)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(f"{folder}/cert.pem", f"{folder}/key.pem")
+            shutil.rmtree(folder)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+            self.url = self.url.replace("http://", "https://")
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row-limited tile download benchmark.")
+    parser.add_argument("--runs", type=int, default=20, help="Downloads per layout and path")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of extra delay per 16KB sent, to simulate a slow link")
+    parser.add_argument("--tls", action="store_true", help="Serve over HTTPS, so new connections pay a TLS handshake")
+    parser.add_argument("--drain-limit", type=int, default=None, help="Bytes left below which a partial download is read to the end")
+    args = parser.parse_args()
+
+    tiles = {}
+    for mode in ("palette", "rgba"):
+        tiles[f"/files/s0/tiles/1/1-{mode}.png"] = encode(build_tile(1), mode)
+    server = TileServer(tiles, args.latency, args.tls)
+    session = requests.Session()
+    session.verify = False
+    session.trust_env = False
+    requests.packages.urllib3.disable_warnings()
+    source = HttpTileSource(session)
+    if args.drain_limit is not None:
+        source.drain_limit = args.drain_limit
+    wplace = WPlace({"arts": {}}, source)
+
+    failures = 0
+    print(f"{'tile':8} {'layout':12} {'full ms':>8} {'rows ms':>8} {'speedup':>8} {'full KB':>8} {'rows KB':>8} {'full conn':>9} {'rows conn':>9}")
+    for path, body in tiles.items():
+        url = server.url + path
+        for name, coords in LAYOUTS:
+            full = wplace.decode_art(source.fetch(url), coords)
+            rows = wplace.decode_art(source.fetch_rows(url, coords[3]), coords)
+            if not np.array_equal(full, rows):
+                failures += 1
+                print(f"MISMATCH {path} {name}")
+
+            timings = {}
+            sent = {}
+            connections = {}
+            for label, fetch in (("full", lambda: source.fetch(url)), ("rows", lambda: source.fetch_rows(url, coords[3]))):
+                server.sent = 0
+                server.connections = 0
+                started = time.perf_counter()
+                for _ in range(args.runs):
+                    wplace.decode_art(fetch(), coords)
+                timings[label] = (time.perf_counter() - started) / args.runs * 1000
+                sent[label] = server.sent / args.runs / 1024
+                connections[label] = server.connections
+
+            mode = path.rsplit("-", 1)[1][:-4]
+            print(f"{mode:8} {name:12} {timings['full']:8.2f} {timings['rows']:8.2f} {timings['full'] / timings['rows']:7.2f}x {sent['full']:8.0f} {sent['rows']:8.0f} {connections['full']:9} {connections['rows']:9}")
+
+    print("All crops match a full decode." if not failures else f"{failures} crops differ from a full decode!")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
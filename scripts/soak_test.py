@@ -0,0 +1,317 @@
+"""
+End-to-end soak test of the automated checks, without touching wplace or Discord.
+
+Starts a fake tile server (synthetic tiles that get griefed on a schedule,
+with optional 429 answers) and a fake Discord webhook in a separate process,
+registers a lot of projects pointing at them in a temporary data folder and
+runs main.automated_check_loop for a while. The fakes live in their own
+process so the memory high-water mark is the checker's alone.
+
+Usage:
+    python scripts/soak_test.py --projects 1000 --duration 300
+"""
+import os
+import re
+import sys
+import cv2
+import json
+import time
+import random
+import argparse
+import requests
+import resource
+import tempfile
+import threading
+import numpy as np
+import multiprocessing
+
+from urllib.parse import urlparse, parse_qs
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from controllers.colors import PALETTE
+
+
+ART_SIZE = 40
+ARTS_PER_ROW = 1000 // ART_SIZE
+
+
+class FakeTileServer:
+    """
+    Serves /files/s0/tiles/<x>/<y>.png like the wplace backend. Tiles are
+    random palette noise and POST /grief/<x>/<y>?box=x0,y0,x1,y1 paints a
+    block over one art. GET /stats returns the request counters.
+    """
+
+    def __init__(self, rate_limit: float = 0.0):
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.tiles = {}      # (x, y) -> BGRA array
+        self.versions = {}   # (x, y) -> version
+        self.encoded = {}    # (x, y) -> (version, png bytes)
+        self.requests = 0
+        self.rate_limited = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                match = re.match(r'^/grief/(\d+)/(\d+)$', url.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                box = tuple(int(v) for v in parse_qs(url.query)["box"][0].split(","))
+                server.grief((int(match.group(1)), int(match.group(2))), box)
+                self.send_json({})
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self.send_json({"requests": server.requests, "rate_limited": server.rate_limited})
+                    return
+                match = re.match(r'^/files/s0/tiles/(\d+)/(\d+)\.png$', self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                server.requests += 1
+                if random.random() < server.rate_limit:
+                    server.rate_limited += 1
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.end_headers()
+                    return
+
+                _, body = server.get_png((int(match.group(1)), int(match.group(2))))
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def get_tile(self, tile):
+        if tile not in self.tiles:
+            rng = np.random.default_rng(tile[0] * 100003 + tile[1])
+            ids = rng.integers(1, 32, (1000, 1000))
+            self.tiles[tile] = np.ascontiguousarray(PALETTE[ids][..., [2, 1, 0, 3]])
+            self.versions[tile] = 0
+        return self.tiles[tile]
+
+    def get_png(self, tile):
+        with self.lock:
+            image = self.get_tile(tile)
+            version = self.versions[tile]
+            cached = self.encoded.get(tile)
+            if cached is None or cached[0] != version:
+                cached = (version, cv2.imencode(".png", image)[1].tobytes())
+                self.encoded[tile] = cached
+            return cached
+
+    def grief(self, tile, box):
+        """
+        Paint a random block inside box = (x0, y0, x1, y1).
+        """
+        with self.lock:
+            image = self.get_tile(tile)
+            x0, y0, x1, y1 = box
+            x = random.randint(x0, x1 - 5)
+            y = random.randint(y0, y1 - 5)
+            color = PALETTE[random.randint(1, 31)][[2, 1, 0, 3]]
+            image[y:y + 5, x:x + 5] = color
+            self.versions[tile] += 1
+
+
+class FakeDiscord:
+    """
+    Records the messages posted to the webhook. GET /messages?since=<n>
+    returns them as [time, content] pairs.
+    """
+
+    def __init__(self):
+        self.messages = []   # (time, content)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/messages":
+                    self.send_error(404)
+                    return
+                since = int(parse_qs(url.query).get("since", ["0"])[0])
+                body = json.dumps(server.messages[since:]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                match = re.search(rb'name="content"\r\n\r\n(.*?)\r\n--', body, re.S)
+                server.messages.append((time.time(), match.group(1).decode(errors="replace") if match else ""))
+                self.send_response(204)
+                self.end_headers()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.url = f"{self.base_url}/webhook"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+def run_fakes(rate_limit: float, urls) -> None:
+    """
+    Run both fakes until the process is terminated, sending their URLs back.
+    """
+    tiles = FakeTileServer(rate_limit)
+    discord = FakeDiscord()
+    tiles.start()
+    discord.start()
+    urls.put((tiles.url, discord.url, discord.base_url))
+    threading.Event().wait()
+
+
+def build_arts(tiles_url: str, webhook: str, projects: int, arts_per_tile: int, digest: bool) -> dict:
+    arts = {}
+    for i in range(projects):
+        tile = (i // arts_per_tile, 0)
+        slot = i % arts_per_tile
+        x, y = (slot % ARTS_PER_ROW) * ART_SIZE, (slot // ARTS_PER_ROW) * ART_SIZE
+        arts[f"soak{i}"] = {
+            "track": True,
+            "check_transparent_pixels": True,
+            "last_checked": "",
+            "griefed": False,
+            "api_image": f"{tiles_url}/files/s0/tiles/{tile[0]}/{tile[1]}.png",
+            "start_coords": {"x": x, "y": y},
+            "end_coords": {"x": x + ART_SIZE, "y": y + ART_SIZE},
+            "min_changed_pixels": 1
+        }
+    return {
+        "discord_webhook": webhook,
+        "cooldown_between_checks": 0,
+        "automated_checks": True,
+        "alert_digest": digest,
+        "alert_digest_window": 0,
+        "arts": arts
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    return float(np.percentile(values, p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of the automated checks against local fakes.")
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--arts-per-tile", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=300, help="Seconds to run after the baseline cycle")
+    parser.add_argument("--grief-interval", type=float, default=1.0, help="Seconds between griefs")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Probability of answering 429")
+    parser.add_argument("--digest", action="store_true", help="Enable alert digests")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    fakes = context.Process(target=run_fakes, args=(args.rate_limit, urls), daemon=True)
+    fakes.start()
+    tiles_url, webhook_url, discord_url = urls.get(timeout=60)
+    control = requests.Session()
+
+    def get_messages(since):
+        return control.get(f"{discord_url}/messages", params={"since": since}).json()
+
+    # main.py works with relative data/ paths
+    workdir = tempfile.mkdtemp(prefix="wplace-soak-")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    config = build_arts(tiles_url, webhook_url, args.projects, args.arts_per_tile, args.digest)
+    with open("data/arts.json", "w") as f:
+        json.dump(config, f)
+    print(f"[SOAK] {args.projects} projects on {len(set(a['api_image'] for a in config['arts'].values()))} tiles in {workdir}")
+
+    import main as app
+    app.TIME_BETWEEN_PROJECT_CHECKS = 0
+    threading.Thread(target=app.automated_check_loop, daemon=True).start()
+
+    # The first cycle captures the baselines
+    while app.AUTOMATION_STATUS["cycles"] < 1:
+        time.sleep(0.5)
+    print(f"[SOAK] Baseline cycle took {app.AUTOMATION_STATUS['last_cycle_seconds']:.1f}s")
+
+    griefs = {}   # project -> time of the first grief not alerted yet
+    griefed = 0
+    cycle_times = []
+    seen_cycles = app.AUTOMATION_STATUS["cycles"]
+    alerted_messages = len(get_messages(0))
+    latencies = []
+    alerted = set()
+    start = time.time()
+    next_grief = start
+
+    while time.time() - start < args.duration:
+        now = time.time()
+        if now >= next_grief:
+            name = f"soak{random.randrange(args.projects)}"
+            art = config["arts"][name]
+            tile = tuple(int(v) for v in re.findall(r'(\d+)/(\d+)\.png$', art["api_image"])[0])
+            box = (art["start_coords"]["x"], art["start_coords"]["y"], art["end_coords"]["x"], art["end_coords"]["y"])
+            control.post(f"{tiles_url}/grief/{tile[0]}/{tile[1]}", params={"box": ",".join(map(str, box))})
+            griefs.setdefault(name, now)
+            griefed += 1
+            next_grief = now + args.grief_interval
+
+        # Match alerts with pending griefs
+        messages = get_messages(alerted_messages)
+        for sent, content in messages:
+            for name in set(re.findall(r'\bsoak\d+\b', content)):
+                if name in griefs:
+                    latencies.append(sent - griefs.pop(name))
+                    alerted.add(name)
+        alerted_messages += len(messages)
+
+        if app.AUTOMATION_STATUS["cycles"] != seen_cycles:
+            seen_cycles = app.AUTOMATION_STATUS["cycles"]
+            cycle_times.append(app.AUTOMATION_STATUS["last_cycle_seconds"])
+        time.sleep(0.05)
+
+    stats = control.get(f"{tiles_url}/stats").json()
+    fakes.terminate()
+    # Only this process: the checker and the harness, not the fakes
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("[SOAK] Results")
+    print(f"  Cycles:              {len(cycle_times)} (mean {np.mean(cycle_times) if cycle_times else float('nan'):.2f}s, p95 {percentile(cycle_times, 95):.2f}s)")
+    print(f"  Griefs:              {griefed} on {len(alerted) + len(griefs)} projects")
+    print(f"  Detection latency:   p50 {percentile(latencies, 50):.2f}s, p95 {percentile(latencies, 95):.2f}s, max {max(latencies, default=float('nan')):.2f}s")
+    print(f"  Alert delivery:      {len(alerted)}/{len(alerted) + len(griefs)} griefed projects alerted, {alerted_messages} webhook messages")
+    print(f"  Tile requests:       {stats['requests']} ({stats['rate_limited']} rate limited)")
+    print(f"  Checker memory:      {max_rss:.0f} MB high-water")
+
+
+if __name__ == "__main__":
+    main()